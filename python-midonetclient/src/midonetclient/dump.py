@@ -0,0 +1,299 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2016 Midokura SARL, All Rights Reserved.
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Dump and restore of the virtual topology of a tenant.
+
+A dump is a stream of JSON lines, one per object. Each record holds the kind
+of the object, the key of its parent object (None for top-level objects) and
+the DTO returned by the API. Objects are fetched level by level, the children
+of all the objects of a level being listed concurrently.
+
+Restoring creates the objects with their original ids, in dependency order:
+all the objects of the same rank are created concurrently, except the rules
+of a chain that are created one after the other to keep their positions.
+Objects that already exist are left untouched, so a restore can be resumed.
+When restoring into another tenant, the objects are copied instead: they get
+new ids and the references between them are rewritten. Such a copy cannot be
+resumed, running it again creates another copy.
+
+Port bindings are not restored since they refer to physical hosts, and
+neither are the links to ports that are not part of the dump, such as the
+ports of a provider router owned by another tenant.
+"""
+
+import collections
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import threading
+
+from webob import exc
+
+try:
+    _string_types = basestring
+except NameError:
+    _string_types = str
+
+LOG = logging.getLogger(__name__)
+
+# DTO fields that are not restored as part of the object creation. Peer ports
+# are linked once all the ports exist.
+_SKIPPED_FIELDS = ('peerId', 'hostId', 'interfaceName', 'active')
+
+
+class _Kind(object):
+
+    def __init__(self, name, rank, factory, children=(), serial=False,
+                 getter=None):
+        """
+        :param name: kind of the records
+        :param rank: objects are restored in increasing rank order
+        :param factory: name of the method that creates a resource of this
+                        kind, on the API for top-level kinds and on the parent
+                        resource otherwise
+        :param children: (kind, list method name) pairs of child collections
+        :param serial: whether the children of the same parent must be
+                       created one after the other
+        :param getter: function(api, parent, dto) returning an existing
+                       resource, for the kinds that other objects refer to
+        """
+        self.name = name
+        self.rank = rank
+        self.factory = factory
+        self.children = children
+        self.serial = serial
+        self.getter = getter
+
+
+def _dhcp_subnet_key(parent, dto):
+    return [parent, dto['subnetPrefix'], dto['subnetLength']]
+
+
+def _get_dhcp_subnet(api, parent, dto):
+    return parent.get_dhcp_subnet('%s_%s' % (dto['subnetPrefix'],
+                                             dto['subnetLength']))
+
+
+_KINDS = dict((k.name, k) for k in [
+    _Kind('chain', 0, 'add_chain', children=[('rule', 'get_rules')],
+          getter=lambda api, parent, dto: api.get_chain(dto['id'])),
+    _Kind('port-group', 0, 'add_port_group',
+          children=[('port-group-port', 'get_ports')],
+          getter=lambda api, parent, dto: api.get_port_group(dto['id'])),
+    _Kind('router', 1, 'add_router',
+          children=[('router-port', 'get_ports'), ('route', 'get_routes')],
+          getter=lambda api, parent, dto: api.get_router(dto['id'])),
+    _Kind('bridge', 1, 'add_bridge',
+          children=[('bridge-port', 'get_ports'),
+                    ('dhcp-subnet', 'get_dhcp_subnets')],
+          getter=lambda api, parent, dto: api.get_bridge(dto['id'])),
+    _Kind('router-port', 2, 'add_port',
+          getter=lambda api, parent, dto: api.get_port(dto['id'])),
+    _Kind('bridge-port', 2, 'add_port',
+          getter=lambda api, parent, dto: api.get_port(dto['id'])),
+    # Rules may refer to ports (inPorts, outPorts), and the rules of a chain
+    # must be restored together to keep their positions.
+    _Kind('rule', 3, 'add_rule', serial=True),
+    _Kind('route', 3, 'add_route'),
+    _Kind('dhcp-subnet', 3, 'add_dhcp_subnet',
+          children=[('dhcp-host', 'get_dhcp_hosts')],
+          getter=_get_dhcp_subnet),
+    _Kind('port-group-port', 3, 'add_port_group_port'),
+    _Kind('dhcp-host', 4, 'add_dhcp_host'),
+])
+
+_TOP_LEVEL = [('chain', 'get_chains'), ('port-group', 'get_port_groups'),
+              ('router', 'get_routers'), ('bridge', 'get_bridges')]
+
+
+def _key(kind, parent, dto):
+    if kind == 'dhcp-subnet':
+        return _dhcp_subnet_key(parent, dto)
+    return dto.get('id')
+
+
+def _hashable(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+def _is_dumped(kind, dto):
+    # Learned routes are regenerated by MidoNet.
+    return not (kind == 'route' and dto.get('learned'))
+
+
+def _list(job):
+    kind, parent_key, lister = job
+    return kind, parent_key, lister()
+
+
+def dump(api, tenant_id, out, parallelism=8):
+    """Writes the virtual topology of a tenant to the file object `out`.
+
+    Returns the number of records written.
+    """
+    query = {'tenant_id': tenant_id}
+    level = [(kind, None, lambda m=getattr(api, method): m(query))
+             for kind, method in _TOP_LEVEL]
+    count = 0
+    pool = ThreadPool(parallelism)
+    try:
+        while level:
+            next_level = []
+            for kind, parent_key, resources in pool.imap_unordered(_list,
+                                                                   level):
+                for res in resources:
+                    if not _is_dumped(kind, res.dto):
+                        continue
+                    out.write(json.dumps({'kind': kind,
+                                          'parent': parent_key,
+                                          'dto': res.dto}) + '\n')
+                    count += 1
+                    key = _key(kind, parent_key, res.dto)
+                    for child, method in _KINDS[kind].children:
+                        next_level.append((child, key, getattr(res, method)))
+            level = next_level
+    finally:
+        pool.close()
+        pool.join()
+    return count
+
+
+class _Restorer(object):
+
+    def __init__(self, api, tenant_id, copy):
+        self.api = api
+        self.tenant_id = tenant_id
+        self.copy = copy
+        # key -> resource, for the objects that other objects refer to
+        self.resources = {}
+        # dumped id -> id of the restored object, when copying
+        self.ids = {}
+        self.created = 0
+        self.existing = 0
+        self._lock = threading.Lock()
+
+    def _remap(self, value):
+        if isinstance(value, list):
+            return [self._remap(v) for v in value]
+        if isinstance(value, _string_types):
+            return self.ids.get(value, value)
+        return value
+
+    def restore(self, record):
+        kind = _KINDS[record['kind']]
+        parent_key = record['parent']
+        dto = dict((k, v) for k, v in record['dto'].items()
+                   if k not in _SKIPPED_FIELDS)
+        if self.tenant_id is not None and 'tenantId' in dto:
+            dto['tenantId'] = self.tenant_id
+        if self.copy:
+            # Objects are referred to by id only, and the referenced objects
+            # have a lower rank so their new ids are already known.
+            old_id = dto.pop('id', None)
+            dto = dict((k, self._remap(v)) for k, v in dto.items())
+
+        if parent_key is None:
+            parent = None
+            res = getattr(self.api, kind.factory)()
+        else:
+            parent = self.resources[_hashable(parent_key)]
+            res = getattr(parent, kind.factory)()
+        res.dto.update(dto)
+        try:
+            res.create()
+            with self._lock:
+                self.created += 1
+        except exc.HTTPConflict:
+            if self.copy:
+                raise
+            with self._lock:
+                self.existing += 1
+            if kind.getter is None:
+                return
+            res = kind.getter(self.api, parent, dto)
+        if self.copy and old_id is not None:
+            self.ids[old_id] = res.dto['id']
+        if kind.getter is not None:
+            key = _key(kind.name, parent_key, record['dto'])
+            self.resources[_hashable(key)] = res
+
+    def restore_all(self, records):
+        for record in records:
+            self.restore(record)
+
+    def link(self, port):
+        res = self.resources[port['id']]
+        if res.dto.get('peerId') is None:
+            res.link(self.ids.get(port['peerId'], port['peerId']))
+
+
+def restore(api, in_, parallelism=8, tenant_id=None):
+    """Recreates the objects dumped to the file object `in_`.
+
+    If `tenant_id` is given, the objects are restored into that tenant instead
+    of the original one, as copies with new ids. Returns a (created, already
+    existing, unlinked) tuple with the number of objects and the ids of the
+    dumped ports whose peer is not part of the dump and which are left
+    unlinked.
+    """
+    ranks = collections.defaultdict(list)
+    ports = []
+    tenants = set()
+    for line in in_:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        ranks[_KINDS[record['kind']].rank].append(record)
+        dto = record['dto']
+        if dto.get('tenantId'):
+            tenants.add(dto['tenantId'])
+        if record['kind'].endswith('-port') and dto.get('peerId'):
+            ports.append(dto)
+
+    # Each link is made once, from the port with the lowest id.
+    port_ids = set(port['id'] for port in ports)
+    links = [port for port in ports
+             if port['peerId'] in port_ids and port['id'] < port['peerId']]
+    unlinked = sorted(port['id'] for port in ports
+                      if port['peerId'] not in port_ids)
+    for port_id in unlinked:
+        LOG.warning("not linking port %s, its peer was not dumped", port_id)
+
+    copy = tenant_id is not None and bool(tenants - set([tenant_id]))
+    restorer = _Restorer(api, tenant_id, copy)
+    pool = ThreadPool(parallelism)
+    try:
+        for rank in sorted(ranks):
+            # Each batch is a list of records restored sequentially, batches
+            # of the same rank are restored concurrently.
+            batches = []
+            serial = collections.OrderedDict()
+            for record in ranks[rank]:
+                if _KINDS[record['kind']].serial:
+                    key = (record['kind'], _hashable(record['parent']))
+                    serial.setdefault(key, []).append(record)
+                else:
+                    batches.append([record])
+            batches.extend(serial.values())
+            LOG.debug("restoring %d objects of rank %d", len(ranks[rank]),
+                      rank)
+            pool.map(restorer.restore_all, batches)
+        pool.map(restorer.link, links)
+    finally:
+        pool.close()
+        pool.join()
+    return restorer.created, restorer.existing, unlinked
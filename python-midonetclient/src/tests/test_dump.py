@@ -0,0 +1,202 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2016 Midokura SARL, All Rights Reserved.
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import itertools
+import json
+import unittest
+
+from webob import exc
+
+from midonetclient import dump
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# add_* method suffix -> name of the collection
+_COLLECTIONS = {'port_group_port': 'ports',
+                'dhcp_subnet': 'dhcp_subnets',
+                'dhcp_host': 'dhcp_hosts'}
+
+
+class FakeResource(object):
+    """In-memory stand-in for a REST resource and its child collections."""
+
+    def __init__(self, api, siblings, dto=None):
+        self.api = api
+        self.siblings = siblings
+        self.dto = dict(dto or {})
+        self.children = {}
+
+    def create(self):
+        if 'subnetPrefix' in self.dto or 'mac' in self.dto:
+            key = (id(self.siblings), self.dto.get('subnetPrefix') or
+                   self.dto.get('mac'))
+        else:
+            key = self.dto.setdefault('id', 'new%d' % next(self.api.ids))
+        if key in self.api.objects:
+            raise exc.HTTPConflict()
+        self.api.objects[key] = self
+        self.siblings.append(self)
+        self.api.created.append(self.dto)
+        return self
+
+    def link(self, peer_id):
+        if peer_id not in self.api.objects:
+            raise exc.HTTPNotFound()
+        self.dto['peerId'] = peer_id
+        self.api.links.append((self.dto['id'], peer_id))
+
+    def get_dhcp_subnet(self, subnet):
+        return self.api.objects[(id(self.children['dhcp_subnets']),
+                                 subnet.split('_')[0])]
+
+    def __getattr__(self, name):
+        if name.startswith('get_'):
+            collection = name[len('get_'):]
+            return lambda query=None: list(self.children.get(collection, []))
+        if name.startswith('add_'):
+            suffix = name[len('add_'):]
+            collection = _COLLECTIONS.get(suffix, suffix + 's')
+            siblings = self.children.setdefault(collection, [])
+            return lambda: FakeResource(self.api, siblings)
+        raise AttributeError(name)
+
+
+class FakeApi(FakeResource):
+
+    def __init__(self):
+        super(FakeApi, self).__init__(self, [])
+        self.objects = {}
+        self.ids = itertools.count()
+        self.created = []
+        self.links = []
+
+    def _get(self, id_):
+        return self.objects[id_]
+
+    get_chain = get_port_group = get_router = get_bridge = get_port = _get
+
+    def put(self, parent, add_method, dto):
+        res = getattr(parent, add_method)()
+        res.dto.update(dto)
+        return res.create()
+
+
+class TestDump(unittest.TestCase):
+
+    def _topology(self):
+        api = FakeApi()
+        chain = api.put(api, 'add_chain', {'id': 'c1', 'tenantId': 't'})
+        api.put(chain, 'add_rule', {'id': 'r1', 'position': 1})
+        api.put(chain, 'add_rule', {'id': 'r2', 'position': 2})
+        router = api.put(api, 'add_router', {'id': 'rt', 'tenantId': 't',
+                                             'inboundFilterId': 'c1'})
+        api.put(router, 'add_port', {'id': 'p1', 'peerId': 'p2'})
+        api.put(router, 'add_route', {'id': 'ro1', 'nextHopPort': 'p1'})
+        api.put(router, 'add_route', {'id': 'ro2', 'learned': True})
+        bridge = api.put(api, 'add_bridge', {'id': 'b', 'tenantId': 't'})
+        api.put(bridge, 'add_port', {'id': 'p2', 'peerId': 'p1',
+                                     'hostId': 'h'})
+        subnet = api.put(bridge, 'add_dhcp_subnet',
+                         {'subnetPrefix': '10.0.0.0', 'subnetLength': 24})
+        api.put(subnet, 'add_dhcp_host', {'mac': 'aa:bb:cc:dd:ee:ff'})
+        return api
+
+    def _dump(self, api):
+        out = StringIO()
+        dump.dump(api, 't', out, parallelism=4)
+        return out.getvalue()
+
+    def test_dump_writes_one_record_per_object(self):
+        records = [json.loads(line) for line in
+                   self._dump(self._topology()).splitlines()]
+        kinds = sorted(r['kind'] for r in records)
+        self.assertEqual(['bridge', 'bridge-port', 'chain', 'dhcp-host',
+                          'dhcp-subnet', 'route', 'router', 'router-port',
+                          'rule', 'rule'], kinds)
+        host = next(r for r in records if r['kind'] == 'dhcp-host')
+        self.assertEqual(['b', '10.0.0.0', 24], host['parent'])
+
+    def test_restore_recreates_objects_in_order(self):
+        dumped = self._dump(self._topology())
+        target = FakeApi()
+        created, existing, unlinked = dump.restore(
+            target, StringIO(dumped), parallelism=4, tenant_id='t')
+        self.assertEqual((10, 0, []), (created, existing, unlinked))
+
+        ids = [d.get('id') for d in target.created]
+        self.assertLess(ids.index('c1'), ids.index('r1'))
+        self.assertLess(ids.index('r1'), ids.index('r2'))
+        self.assertLess(ids.index('p1'), ids.index('ro1'))
+        self.assertEqual([('p1', 'p2')], target.links)
+        for dto in target.created:
+            self.assertNotIn('hostId', dto)
+
+    def test_restore_skips_existing_objects(self):
+        api = self._topology()
+        dumped = self._dump(api)
+        created, existing, _ = dump.restore(api, StringIO(dumped))
+        self.assertEqual(0, created)
+        self.assertEqual(10, existing)
+
+    def test_restore_into_another_tenant_copies_objects(self):
+        api = self._topology()
+        dumped = self._dump(api)
+        before = len(api.created)
+        created, existing, unlinked = dump.restore(
+            api, StringIO(dumped), parallelism=4, tenant_id='t2')
+        self.assertEqual((10, 0, []), (created, existing, unlinked))
+
+        copies = dict((d.get('id'), d) for d in api.created[before:])
+        for dto in copies.values():
+            self.assertNotIn(dto.get('id'), ('c1', 'r1', 'r2', 'rt', 'p1',
+                                              'p2', 'b', 'ro1'))
+            if 'tenantId' in dto:
+                self.assertEqual('t2', dto['tenantId'])
+        router = next(d for d in copies.values() if 'inboundFilterId' in d)
+        chain = copies[router['inboundFilterId']]
+        self.assertEqual('t2', chain['tenantId'])
+        route = next(d for d in copies.values() if 'nextHopPort' in d)
+        port = copies[route['nextHopPort']]
+        self.assertEqual(1, len(api.links))
+        self.assertIn(port['id'], api.links[0])
+        self.assertIn(port['peerId'], copies)
+
+    def test_restore_skips_links_to_ports_not_dumped(self):
+        api = self._topology()
+        # Peers on a provider router of another tenant, which is not dumped.
+        # One peer id sorts before the dumped port, the other one after.
+        router = api.objects['rt']
+        api.put(router, 'add_port', {'id': 'p3', 'peerId': 'a0',
+                                     'portAddress': '10.0.1.1'})
+        api.put(router, 'add_port', {'id': 'p4', 'peerId': 'z9'})
+        chain = api.objects['c1']
+        api.put(chain, 'add_rule', {'id': 'r3', 'position': 3,
+                                    'inPorts': ['p3']})
+        dumped = self._dump(api)
+
+        target = FakeApi()
+        created, existing, unlinked = dump.restore(
+            target, StringIO(dumped), parallelism=4, tenant_id='t2')
+        self.assertEqual((13, 0), (created, existing))
+        self.assertEqual(['p3', 'p4'], unlinked)
+        self.assertEqual(1, len(target.links))
+        port = next(d for d in target.created if 'portAddress' in d)
+        rule = next(d for d in target.created if 'inPorts' in d)
+        self.assertEqual([port['id']], rule['inPorts'])
@@ -34,5 +34,5 @@ def reset_sandbox():
                             'sandbox/override_compat',
                             'sandbox/provisioning/compat-provisioning.sh')
     # Reset cached containers and reload them (await for services to be up)
-    service.loaded_containers = None
+    service.reset_containers()
     setup_package()
\ No newline at end of file
@@ -30,6 +30,10 @@ OPTIONS:
  -t TEST     Runs this test(s)
  -l LOG_DIR  Directory where to store results (defaults to ./logs)
  -n SANDBOX  Use this sandbox name to run the tests on (defaults to mdts)
+ -N SANDBOXES
+             Run the tests in parallel on these sandboxes (comma separated),
+             balancing the durations of their last runs. Not supported
+             with containers_file set (SSH mode)
  -g          Do not run gate tests
  -G          Run only gate tests
  -s          Do not run slow tests
@@ -46,6 +50,7 @@ EXAMPLES:
 $0 -t test_bridge.py
 $0 -t test_bridge.py:test_icmp
 $0 -t test_bridge.py:test_icmp -t test_router.py -t test_l2gw.py:test_icmp_from_mn
+$0 -N mdts1,mdts2,mdts3
 
 DEBUGGING:
 If you want the test to stop upon an exception and open an interactive session with 
@@ -66,7 +71,7 @@ ATTR=""
 ARGS=""  # passed directly to nosetests runner
 LOG_DIR="logs-$(date +"%y%m%d%H%M%S")"
 
-while getopts "e:ht:sSv:V:xXr:l:gGn:" OPTION
+while getopts "e:ht:sSv:V:xXr:l:gGn:N:" OPTION
 do
     case $OPTION in
         h)
@@ -112,6 +117,9 @@ do
         n)
             export MDTS_SANDBOX_NAME=$OPTARG
             ;;
+        N)
+            export MDTS_SANDBOX_NAMES=$OPTARG
+            ;;
         s)
             if [ -z "$ATTR" ]
             then
@@ -14,8 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from mdts.lib import parallel_runner
 from mdts.lib.nose_plugin import Mdts
+from mdts.utils import conf
 import nose
+import sys
 
 if __name__ == '__main__':
+    sandbox_names = conf.sandbox_names()
+    if len(sandbox_names) > 1:
+        sys.exit(parallel_runner.main(sandbox_names, sys.argv[1:]))
     nose.main(addplugins=[Mdts()])
@@ -12,11 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import logging
 from mdts.lib.topology_manager import TopologyManager
 from mdts.services import service
-from mdts.utils.utils import await_port_active
+from mdts.utils.utils import await_ports_active
 from mdts.utils.utils import get_midonet_api
+from mdts.utils.utils import run_in_parallel
 import sys
 
 LOG = logging.getLogger(__name__)
@@ -49,14 +51,32 @@ class BindingManager(TopologyManager):
     def bind(self, filename=None):
         self._ptm.build()
         self._vtm.build()
-        # Get a new api ref to workaround previous zk failures
+        # Shared API client, checked again if its last check is not recent
         self._api = get_midonet_api()
 
-        bindings = self._data['bindings']
-        for b in bindings:
+        # Bindings are grouped by host: the interfaces of a host are created
+        # and bound one after the other, different hosts concurrently.
+        by_host = collections.OrderedDict()
+        for b in self._data['bindings']:
             binding = b['binding']
-
-            host_id = binding['host_id']
+            by_host.setdefault(binding['host_id'], []).append(binding)
+
+        vport_ids = run_in_parallel(
+            [lambda h=host_id, b=bindings: self._bind_host(h, b)
+             for host_id, bindings in by_host.items()])
+        await_ports_active([vport_id for host_vport_ids in vport_ids
+                            for vport_id in host_vport_ids])
+
+    def _bind_host(self, host_id, bindings):
+        """
+        Creates and binds the interfaces of the bindings on a host, one after
+        the other.
+
+        :return: the ids of the bound vports
+        """
+        vport_ids = []
+        host = service.get_container_by_hostname('midolman%s' % host_id)
+        for binding in bindings:
             iface_id = binding['interface_id']
             device_name = binding['device_name']
             port_id = binding['port_id']
@@ -72,7 +92,6 @@ class BindingManager(TopologyManager):
             # are referenced by hostname. Need a coherent mechanism
             # Cleanup everything not related to bindings from here
             if 'host_id' in binding:
-                host_id = binding['host_id']
                 # FIXME:
                 # Clean up yamls or remove them completely, this is so ugly
                 _host = filter(
@@ -93,7 +112,6 @@ class BindingManager(TopologyManager):
             )[0]['interface']
 
             mn_vport_id = mn_vport.get_id()
-            host = service.get_container_by_hostname('midolman%s' % host_id)
 
             if _interface['type'] == 'netns':
                 iface = host.create_vmguest(**_interface)
@@ -110,15 +128,23 @@ class BindingManager(TopologyManager):
 
             iface.vport_id = mn_vport_id
             host.bind_port(iface, mn_vport_id)
-            await_port_active(mn_vport_id)
-
-    def unbind(self):
+            vport_ids.append(mn_vport_id)
+        return vport_ids
 
-        for iface, host in self._interfaces:
+    def _unbind_host(self, interfaces):
+        for iface, host in interfaces:
             # Remove binding
             host.unbind_port(iface)
             iface.destroy()
 
+    def unbind(self):
+        # Interfaces are unbound and destroyed concurrently on each host
+        by_host = collections.OrderedDict()
+        for iface, host in self._interfaces:
+            by_host.setdefault(host.get_hostname(), []).append((iface, host))
+        run_in_parallel([lambda i=interfaces: self._unbind_host(i)
+                         for interfaces in by_host.values()])
+
         # Destroy the virtual topology
         self._vtm.destroy()
         self._ptm.destroy()
@@ -12,11 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import fixtures
 from fixtures import callmany
 from mdts.lib.topology_manager import TopologyManager
 from mdts.services import service
-from mdts.utils.utils import await_port_active
+from mdts.utils.utils import await_ports_active
+from mdts.utils.utils import run_in_parallel
 import uuid  # noqa
 
 import logging
@@ -83,15 +85,15 @@ class BindingManager(fixtures.Fixture):
         # If not a neutron port, both ip and hw addr should be specified
         return dict(iface)
 
-    def bind(self):
-        # Schedule deletion of virtual and physical topologies
-        self.addCleanup(self._ptm.destroy)
-        self._ptm.build(self._data)
-        self.addCleanup(self._vtm.destroy)
-        self._add_hosts_to_tunnel_zone()
-        self._vtm.build(self._data)
-        for binding in self._data['bindings']:
-            vport = self._vtm.get_resource(binding['vport'])
+    def _bind_host(self, bindings, cleanups):
+        """
+        Creates and binds the interfaces of the bindings on a host, one after
+        the other. The cleanups are appended to `cleanups` as they are needed.
+
+        :return: the ids of the bound vports
+        """
+        vport_ids = []
+        for binding, vport in bindings:
             bind_iface = binding['interface']
             if isinstance(bind_iface, dict):
                 # We are specifying the vms inside the binding
@@ -100,7 +102,8 @@ class BindingManager(fixtures.Fixture):
                 hostname = bind_iface['hostname']
                 host = service.get_container_by_hostname(hostname)
                 iface = getattr(host, "create_%s" % iface_type)(**iface_def)
-                self.addCleanup(getattr(host, "destroy_%s" % iface_type), iface)
+                cleanups.append((getattr(host, "destroy_%s" % iface_type),
+                                 iface))
             else:
                 # It's a vm already created and saved as a resource
                 iface = self._ptm.get_resource(binding['interface'])
@@ -108,10 +111,60 @@ class BindingManager(fixtures.Fixture):
             vport_id = self._get_port_id(vport)
 
             # Do the actual binding
-            binding = iface.compute_host.bind_port(iface, vport_id)
-            self.addCleanup(iface.compute_host.unbind_port, iface)
+            iface.compute_host.bind_port(iface, vport_id)
+            cleanups.append((iface.compute_host.unbind_port, iface))
             self._mappings[vport_id] = iface
-            await_port_active(vport_id)
+            vport_ids.append(vport_id)
+        return vport_ids
+
+    def _cleanup_hosts(self, cleanups):
+        """
+        Runs the cleanups of each host in reverse order, hosts being cleaned
+        up concurrently.
+        """
+        def cleanup_host(host_cleanups):
+            error = None
+            while host_cleanups:
+                func, arg = host_cleanups.pop()
+                try:
+                    func(arg)
+                except Exception as e:
+                    LOG.exception("Error cleaning up binding")
+                    error = error or e
+            if error:
+                raise error
+
+        run_in_parallel([lambda c=c: cleanup_host(c)
+                         for c in cleanups.values()])
+
+    def bind(self):
+        # Schedule deletion of virtual and physical topologies
+        self.addCleanup(self._ptm.destroy)
+        self._ptm.build(self._data)
+        self.addCleanup(self._vtm.destroy)
+        self._add_hosts_to_tunnel_zone()
+        self._vtm.build(self._data)
+
+        # Bindings are grouped by host: the interfaces of a host are created
+        # and bound one after the other, different hosts concurrently.
+        by_host = collections.OrderedDict()
+        for binding in self._data['bindings']:
+            vport = self._vtm.get_resource(binding['vport'])
+            bind_iface = binding['interface']
+            if isinstance(bind_iface, dict):
+                hostname = bind_iface['hostname']
+            else:
+                iface = self._ptm.get_resource(bind_iface)
+                hostname = iface.compute_host.get_hostname()
+            by_host.setdefault(hostname, []).append((binding, vport))
+
+        cleanups = dict((hostname, []) for hostname in by_host)
+        self.addCleanup(self._cleanup_hosts, cleanups)
+        vport_ids = run_in_parallel(
+            [lambda b=bindings, c=cleanups[hostname]: self._bind_host(b, c)
+             for hostname, bindings in by_host.items()])
+        await_ports_active([vport_id for host_vport_ids in vport_ids
+                            for vport_id in host_vport_ids])
 
         # create and bind a "router", which is actually just a namespace
         # residing on the host with multiple interfaces that can be bound
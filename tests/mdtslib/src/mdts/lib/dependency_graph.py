@@ -0,0 +1,112 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A graph of tasks that depend on each other, such as the creation of topology
+resources, run concurrently in the order of their dependencies.
+"""
+
+import collections
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from mdts.lib.mdts_exception import MdtsException
+
+
+class DependencyCycleException(MdtsException):
+    """Exception raised when tasks depend on each other in a cycle."""
+    pass
+
+
+class DependencyGraph(object):
+
+    def __init__(self):
+        # key -> function taking no arguments, in the order they were added
+        self._tasks = collections.OrderedDict()
+        # key -> keys of the tasks it depends on
+        self._dependencies = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def add(self, key, func, depends_on=()):
+        """Adds a task to the graph.
+
+        Args:
+            key: A unique key for the task.
+            func: The function running the task, taking no arguments.
+            depends_on: Keys of the tasks that must complete before this one.
+                        Keys of tasks not in the graph are ignored.
+        """
+        self._tasks[key] = func
+        self._dependencies[key] = set(depends_on)
+
+    def levels(self):
+        """Returns the keys of the tasks grouped by level.
+
+        The tasks of a level only depend on tasks of the previous levels.
+        Within a level, keys are in the order the tasks were added.
+        """
+        remaining = collections.OrderedDict(
+            (key, self._dependencies[key] & set(self._tasks))
+            for key in self._tasks)
+        done = set()
+        levels = []
+        while remaining:
+            level = [key for key, deps in remaining.items() if deps <= done]
+            if not level:
+                raise DependencyCycleException(
+                    "Tasks depend on each other in a cycle: %s" %
+                    ', '.join(str(key) for key in remaining))
+            for key in level:
+                del remaining[key]
+            done.update(level)
+            levels.append(level)
+        return levels
+
+    def run(self, max_workers=8):
+        """Runs the tasks, each one as soon as all its dependencies are done.
+
+        When a task fails, no more tasks are started, and the error of the
+        first failed task is raised once the running ones complete.
+
+        Args:
+            max_workers: The maximum number of tasks running at once.
+        """
+        # Check for cycles before starting anything
+        self.levels()
+        pending = collections.OrderedDict(
+            (key, self._dependencies[key] & set(self._tasks))
+            for key in self._tasks)
+        done = set()
+        running = {}
+        failed = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                if failed is None:
+                    for key in list(pending):
+                        if pending[key] <= done:
+                            del pending[key]
+                            running[executor.submit(self._tasks[key])] = key
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key = running.pop(future)
+                    if future.exception() is not None:
+                        failed = failed or future
+                    else:
+                        done.add(key)
+        if failed is not None:
+            failed.result()
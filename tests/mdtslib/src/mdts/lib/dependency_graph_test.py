@@ -0,0 +1,69 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit test module for DependencyGraph.
+"""
+
+from mdts.lib.dependency_graph import DependencyCycleException
+from mdts.lib.dependency_graph import DependencyGraph
+
+import threading
+import unittest
+
+
+class DependencyGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self._graph = DependencyGraph()
+        self._done = []
+        self._lock = threading.Lock()
+
+    def _task(self, key, error=None):
+        def run():
+            if error:
+                raise error
+            with self._lock:
+                self._done.append(key)
+        return run
+
+    def test_levels(self):
+        self._graph.add('a', self._task('a'))
+        self._graph.add('b', self._task('b'), ['a'])
+        self._graph.add('c', self._task('c'))
+        self._graph.add('d', self._task('d'), ['b', 'c', 'unknown'])
+        self.assertEqual([['a', 'c'], ['b'], ['d']], self._graph.levels())
+
+    def test_run_in_dependency_order(self):
+        self._graph.add('a', self._task('a'))
+        self._graph.add('b', self._task('b'), ['a'])
+        self._graph.add('c', self._task('c'), ['b'])
+        self._graph.run(max_workers=4)
+        self.assertEqual(['a', 'b', 'c'], self._done)
+
+    def test_run_stops_on_error(self):
+        self._graph.add('a', self._task('a', ValueError('a failed')))
+        self._graph.add('b', self._task('b'), ['a'])
+        self.assertRaises(ValueError, self._graph.run)
+        self.assertEqual([], self._done)
+
+    def test_cycle(self):
+        self._graph.add('a', self._task('a'), ['b'])
+        self._graph.add('b', self._task('b'), ['a'])
+        self.assertRaises(DependencyCycleException, self._graph.run)
+        self.assertEqual([], self._done)
+
+
+if __name__ == "__main__":
+    unittest.main()
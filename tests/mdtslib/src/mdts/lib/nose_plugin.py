@@ -14,6 +14,7 @@
 
 import logging
 from mdts.services import service
+from mdts.utils.utils import run_in_parallel
 from nose.plugins.base import Plugin
 import os
 import shutil
@@ -53,6 +54,8 @@ class Mdts(Plugin):
         self.log_dir = options.mdts_logs_dir
         self.xunit_file = options.xunit_file
         self.test_markers = {}
+        # test id -> hostname -> log file -> [start offset, end offset]
+        self.test_log_offsets = {}
         if os.path.exists(self.log_dir):
             shutil.rmtree(self.log_dir, ignore_errors=True)
             os.mkdir(self.log_dir)
@@ -62,18 +65,36 @@ class Mdts(Plugin):
         timestamp = time.strftime("%y%m%d%H%M%S")
         marker = self._get_markers_for_test(test.id(), timestamp)
         self.test_markers[test.id()] = marker
-        service_hosts = self._get_all_services()
-        if test.id() in self.test_markers:
-            for service_host in service_hosts:
-                service_host.set_log_marker(marker['start'])
+        offsets = self._set_log_markers(marker['start'])
+        self.test_log_offsets[test.id()] = dict(
+            (hostname, dict((log_file, [offset, None])
+                            for log_file, offset in log_offsets.items()))
+            for hostname, log_offsets in offsets.items())
 
     def afterTest(self, test):
         """Inserts merker to the MM logs"""
-        service_hosts = self._get_all_services()
         if test.id() in self.test_markers:
             marker = self.test_markers[test.id()]
-            for service_host in service_hosts:
-                service_host.set_log_marker(marker['end'])
+            offsets = self._set_log_markers(marker['end'])
+            test_offsets = self.test_log_offsets.get(test.id(), {})
+            for hostname, log_offsets in offsets.items():
+                for log_file, offset in log_offsets.items():
+                    if log_file in test_offsets.get(hostname, {}):
+                        test_offsets[hostname][log_file][1] = offset
+
+    def _set_log_markers(self, marker):
+        """Inserts a marker to the logs of all services concurrently
+
+        :return: dict of hostname -> log file -> offset of the marker
+        """
+        service_hosts = self._get_all_services()
+        offsets = run_in_parallel(
+            [lambda h=service_host: h.set_log_marker(marker)
+             for service_host in service_hosts],
+            max_workers=len(service_hosts) or 1)
+        return dict((service_host.get_hostname(), log_offsets)
+                    for service_host, log_offsets
+                    in zip(service_hosts, offsets))
 
     # Methods executed before cleaning up the topology
     def formatFailure(self, test, err):
@@ -89,6 +110,7 @@ class Mdts(Plugin):
         if os.path.exists(self.xunit_file):
             service_hosts = self._get_all_services()
             debug_suite = False
+            writers = []
             tree = ET.parse(self.xunit_file)
             root = tree.getroot()
             for test_case in root:
@@ -104,7 +126,11 @@ class Mdts(Plugin):
                     debug_suite = True
                     failure.text += '\n'
                     for service_host in service_hosts:
-                        self._write_service_log_files(service_host, test_id)
+                        writers.append(
+                            lambda h=service_host, t=test_id:
+                            self._write_service_log_files(h, t))
+
+            run_in_parallel(writers)
 
             if debug_suite:
                 self._write_per_suite_debug_info()
@@ -121,34 +147,36 @@ class Mdts(Plugin):
 
     def _write_per_suite_debug_info(self):
         service_hosts = self._get_all_services()
-        for service_host in service_hosts:
-            service_debug_log = service_host.get_debug_logs()
-            if service_debug_log:
-                with open("%s/%s-debug.log" % (
-                    self.log_dir,
-                    service_host.get_hostname()
-                ), 'w') as f:
-                    f.write(service_debug_log)
-
-            service_full_logs = service_host.get_full_logs()
-            for log_file, log_stream in service_full_logs.items():
-                log_file_name = log_file.split('/')[-1]
-                with open("%s/%s-%s" % (
-                    self.log_dir,
-                    service_host.get_hostname(),
-                    log_file_name
-                ), "w") as f:
-                    f.write(log_stream)
-
-            with open("%s/%s-docker.log" % (
-                    self.log_dir,
-                    service_host.get_hostname()
+        run_in_parallel(
+            [lambda h=service_host: self._write_service_debug_info(h)
+             for service_host in service_hosts])
+
+    def _write_service_debug_info(self, service_host):
+        service_debug_log = service_host.get_debug_logs()
+        if service_debug_log:
+            with open("%s/%s-debug.log" % (
+                self.log_dir,
+                service_host.get_hostname()
             ), 'w') as f:
-                p = subprocess.Popen(
-                    ["docker", "logs", service_host.get_name()],
-                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                output, err = p.communicate()
-                f.write(output)
+                f.write(service_debug_log)
+
+        for log_file in service_host.get_service_logs():
+            log_file_name = log_file.split('/')[-1]
+            service_host.write_log(log_file, "%s/%s-%s.gz" % (
+                self.log_dir,
+                service_host.get_hostname(),
+                log_file_name
+            ))
+
+        with open("%s/%s-docker.log" % (
+                self.log_dir,
+                service_host.get_hostname()
+        ), 'w') as f:
+            p = subprocess.Popen(
+                ["docker", "logs", service_host.get_name()],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output, err = p.communicate()
+            f.write(output)
 
     def _write_per_test_debug_info(self, test, result):
         test_id = test.id()
@@ -189,20 +217,20 @@ class Mdts(Plugin):
                 f.write(mmdpctl_dump)
 
     def _write_service_log_files(self, service, test_id):
-        if test_id not in self.test_markers:
+        if test_id not in self.test_log_offsets:
             return
-        marker = self.test_markers[test_id]
-        service_logs = service.get_test_log(marker['start'],
-                                            marker['end'])
+        log_offsets = self.test_log_offsets[test_id].get(
+            service.get_hostname(), {})
         service_dir = "%s/%s/%s" % (self.log_dir,
                                     test_id,
                                     service.get_hostname())
         if not os.path.isdir(service_dir):
             os.makedirs(service_dir)
-        for log_file, log_stream in service_logs.items():
+        for log_file, (start, end) in log_offsets.items():
             log_file_name = log_file.split('/')[-1]
-            with open("%s/%s" % (service_dir, log_file_name), "w") as f:
-                f.write(log_stream)
+            service.write_log(log_file,
+                              "%s/%s.gz" % (service_dir, log_file_name),
+                              start, end)
 
     def _get_markers_for_test(self, test_id, timestamp):
         """Returns a dict for log markers, keyed by 'start' and 'end'"""
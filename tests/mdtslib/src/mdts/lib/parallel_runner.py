@@ -0,0 +1,259 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import heapq
+import json
+import logging
+from mdts.services import service
+from mdts.utils import conf
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+"""
+Runs the tests on several sandboxes at once.
+
+The tests are sharded by test module (or by test, when given as
+test_file.py:test_name) across the sandboxes, balancing the durations of their
+last runs. Each shard is run by its own nose process, with MDTS_SANDBOX_NAME
+set to its sandbox, so that the services used by its tests are those of that
+sandbox. The xunit reports of the shards are then merged into one.
+
+Sandboxes are only supported with the Docker API: when running over SSH
+against the hosts of a containers_file, there is a single set of hosts, and
+shards would tear down each other's topologies and bindings.
+"""
+
+LOG = logging.getLogger(__name__)
+
+# Duration assumed for tests that never ran, if no other test ran either
+DEFAULT_TEST_DURATION = 60.0
+
+
+def _pop_option(args, name, default=None):
+    """Removes an option and its value from a list of arguments
+
+    :return: the value of the option, default if not present
+    """
+    value = default
+    remaining = []
+    args_iter = iter(args)
+    for arg in args_iter:
+        if arg == name:
+            value = next(args_iter, default)
+        elif arg.startswith(name + '='):
+            value = arg[len(name) + 1:]
+        else:
+            remaining.append(arg)
+    args[:] = remaining
+    return value
+
+
+def _is_test(arg):
+    path = arg.split(':')[0]
+    return os.path.basename(path).startswith('test') and \
+        path.endswith('.py') and os.path.isfile(path)
+
+
+def find_tests(args):
+    """Removes the tests from a list of nose arguments
+
+    :return: the tests, or all test modules of the current directory if none
+             was given
+    """
+    tests = [arg for arg in args if _is_test(arg)]
+    args[:] = [arg for arg in args if not _is_test(arg)]
+    return tests or sorted(glob.glob('test_*.py'))
+
+
+def load_durations(path):
+    """
+    :return: dict of test id -> duration in seconds of its last run
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_durations(path, durations):
+    with open(path, 'w') as f:
+        json.dump(durations, f, indent=2, sort_keys=True)
+
+
+def estimate_duration(test, durations, default):
+    """Returns the duration of the last run of a test module or test
+
+    :param test: test_file.py or test_file.py:test_name
+    :param durations: dict of test id -> duration
+    :param default: duration of tests that never ran
+    """
+    path, _, name = test.partition(':')
+    module = os.path.basename(path)[:-len('.py')]
+    total = None
+    for test_id, duration in durations.items():
+        if module not in test_id.split('.'):
+            continue
+        if name and not (test_id.endswith('.' + name) or
+                         ('.' + name + '.') in test_id):
+            continue
+        total = (total or 0) + duration
+    return default if total is None else total
+
+
+def shard(tests, durations, count):
+    """Splits the tests in shards of about the same total duration
+
+    The longest tests are assigned first, each one to the shard with the
+    shortest total duration so far.
+
+    :return: list of count lists of tests
+    """
+    default = (sum(durations.values()) / len(durations)
+               if durations else DEFAULT_TEST_DURATION)
+    estimates = dict((test, estimate_duration(test, durations, default))
+                     for test in tests)
+    shards = [[] for _ in range(count)]
+    heap = [(0.0, i) for i in range(count)]
+    for test in sorted(tests, key=lambda t: (-estimates[t], t)):
+        total, i = heapq.heappop(heap)
+        shards[i].append(test)
+        heapq.heappush(heap, (total + estimates[test], i))
+    for i, shard_tests in enumerate(shards):
+        LOG.info("Shard %d: %.0fs estimated, %s" % (
+            i, sum(estimates[t] for t in shard_tests), ' '.join(shard_tests)))
+    return shards
+
+
+def available_sandboxes(sandbox_names):
+    """Returns the sandboxes with running containers
+
+    Each sandbox is checked with its own service registry.
+    """
+    available = []
+    for sandbox_name in sandbox_names:
+        registry = service.ServiceRegistry(service.create_cli(sandbox_name))
+        if registry.get_all_containers():
+            available.append(sandbox_name)
+        else:
+            LOG.warn("Sandbox %s has no running containers, skipping it" %
+                     sandbox_name)
+    if not available:
+        raise RuntimeError("None of the sandboxes %s is running" %
+                           ', '.join(sandbox_names))
+    return available
+
+
+def merge_xunit(reports, xunit_file):
+    """Merges the xunit reports of the shards into one
+
+    :param reports: list of (sandbox name, report file, exit code of the
+                    shard). Shards that failed without writing their report
+                    are reported as errors.
+    """
+    merged = ET.Element('testsuite', name='nosetests')
+    counts = dict((key, 0) for key in ('tests', 'errors', 'failures', 'skip'))
+    for sandbox_name, report, returncode in reports:
+        if os.path.exists(report):
+            suite = ET.parse(report).getroot()
+            for key in counts:
+                counts[key] += int(suite.get(key, 0))
+            for test_case in suite:
+                merged.append(test_case)
+        else:
+            test_case = ET.SubElement(
+                merged, 'testcase', classname='mdts.parallel_runner',
+                name=sandbox_name, time='0')
+            error = ET.SubElement(test_case, 'error', type='RuntimeError',
+                                  message='No test report')
+            error.text = ('Shard on sandbox %s exited with code %d without '
+                          'writing %s' % (sandbox_name, returncode, report))
+            counts['tests'] += 1
+            counts['errors'] += 1
+    for key, count in counts.items():
+        merged.set(key, str(count))
+    ET.ElementTree(merged).write(xunit_file, encoding='UTF-8',
+                                 xml_declaration=True)
+    return merged
+
+
+def main(sandbox_names, args):
+    """Runs the tests given in the nose arguments on the sandboxes
+
+    :param args: nose arguments, as passed to the runner
+    :return: exit code, 0 if all the tests passed
+    """
+    logging.basicConfig(level=logging.INFO)
+    if conf.containers_file() is not None:
+        LOG.error("Cannot run the tests on several sandboxes (%s) with "
+                  "containers_file set to %s, all the shards would run on "
+                  "the same hosts" % (', '.join(sandbox_names),
+                                      conf.containers_file()))
+        return 2
+    args = list(args)
+    logs_dir = _pop_option(args, '--mdts-logs-dir', 'logs/')
+    xunit_file = _pop_option(args, '--xunit-file', 'nosetests.xml')
+    durations_file = _pop_option(args, '--mdts-durations-file',
+                                 'test-durations.json')
+    tests = find_tests(args)
+    durations = load_durations(durations_file)
+
+    sandbox_names = available_sandboxes(sandbox_names)
+    shards = shard(tests, durations, len(sandbox_names))
+    if not os.path.isdir(logs_dir):
+        os.makedirs(logs_dir)
+
+    start = time.time()
+    processes = []
+    for sandbox_name, shard_tests in zip(sandbox_names, shards):
+        if not shard_tests:
+            continue
+        report = os.path.join(logs_dir, '%s-nosetests.xml' % sandbox_name)
+        if os.path.exists(report):
+            os.remove(report)
+        env = dict(os.environ)
+        env['MDTS_SANDBOX_NAME'] = sandbox_name
+        env['MDTS_SANDBOX_NAMES'] = sandbox_name
+        output = open(os.path.join(logs_dir, '%s.log' % sandbox_name), 'w')
+        process = subprocess.Popen(
+            [sys.executable, sys.argv[0]] + args +
+            ['--mdts-logs-dir', os.path.join(logs_dir, sandbox_name),
+             '--xunit-file', report] + shard_tests,
+            env=env, stdout=output, stderr=subprocess.STDOUT)
+        LOG.info("Running %d tests on sandbox %s (pid %d)" % (
+            len(shard_tests), sandbox_name, process.pid))
+        processes.append((sandbox_name, report, process, output))
+
+    reports = []
+    for sandbox_name, report, process, output in processes:
+        returncode = process.wait()
+        output.close()
+        LOG.info("Tests on sandbox %s exited with code %d" % (
+            sandbox_name, returncode))
+        reports.append((sandbox_name, report, returncode))
+    LOG.info("All shards finished in %.0fs" % (time.time() - start))
+
+    merged = merge_xunit(reports, xunit_file)
+    for test_case in merged:
+        if test_case.get('classname') != 'mdts.parallel_runner':
+            durations['%s.%s' % (test_case.get('classname'),
+                                 test_case.get('name'))] = \
+                float(test_case.get('time', 0))
+    save_durations(durations_file, durations)
+
+    failed = any(returncode != 0 for _, _, returncode in reports)
+    return 1 if failed else 0
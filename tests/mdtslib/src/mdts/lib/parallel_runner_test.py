@@ -0,0 +1,141 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit test module for the parallel test runner.
+"""
+
+from mdts.lib import parallel_runner
+
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+
+class PopOptionTest(unittest.TestCase):
+
+    def test_separate_value(self):
+        args = ['-v', '--xunit-file', 'out.xml', 'test_a.py']
+        self.assertEqual('out.xml',
+                         parallel_runner._pop_option(args, '--xunit-file'))
+        self.assertEqual(['-v', 'test_a.py'], args)
+
+    def test_joined_value(self):
+        args = ['--xunit-file=out.xml', '-v']
+        self.assertEqual('out.xml',
+                         parallel_runner._pop_option(args, '--xunit-file'))
+        self.assertEqual(['-v'], args)
+
+    def test_missing_option(self):
+        args = ['-v']
+        self.assertEqual('default', parallel_runner._pop_option(
+            args, '--xunit-file', 'default'))
+        self.assertEqual(['-v'], args)
+
+
+class EstimateDurationTest(unittest.TestCase):
+
+    DURATIONS = {
+        'test_bridge.test_icmp': 10.0,
+        'test_bridge.test_arp': 5.0,
+        'test_router.TestRouter.test_snat': 20.0,
+    }
+
+    def test_module(self):
+        self.assertEqual(15.0, parallel_runner.estimate_duration(
+            'test_bridge.py', self.DURATIONS, 60.0))
+
+    def test_single_test(self):
+        self.assertEqual(10.0, parallel_runner.estimate_duration(
+            'test_bridge.py:test_icmp', self.DURATIONS, 60.0))
+
+    def test_test_of_a_class(self):
+        self.assertEqual(20.0, parallel_runner.estimate_duration(
+            'test_router.py:TestRouter', self.DURATIONS, 60.0))
+
+    def test_never_ran(self):
+        self.assertEqual(60.0, parallel_runner.estimate_duration(
+            'test_l2gw.py', self.DURATIONS, 60.0))
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_balances_durations(self):
+        durations = {'test_a.t': 40.0, 'test_b.t': 30.0, 'test_c.t': 20.0,
+                     'test_d.t': 10.0}
+        shards = parallel_runner.shard(
+            ['test_a.py', 'test_b.py', 'test_c.py', 'test_d.py'],
+            durations, 2)
+        self.assertEqual([['test_a.py', 'test_d.py'],
+                          ['test_b.py', 'test_c.py']], shards)
+
+    def test_unknown_tests_take_the_average_duration(self):
+        durations = {'test_a.t': 30.0, 'test_b.t': 10.0}
+        shards = parallel_runner.shard(
+            ['test_a.py', 'test_b.py', 'test_new.py'], durations, 2)
+        self.assertEqual([['test_a.py'], ['test_new.py', 'test_b.py']],
+                         shards)
+
+    def test_more_shards_than_tests(self):
+        shards = parallel_runner.shard(['test_a.py'], {}, 3)
+        self.assertEqual([['test_a.py'], [], []], shards)
+
+
+class MergeXunitTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _report(self, name, cases, **counts):
+        path = os.path.join(self._dir, name)
+        suite = ET.Element('testsuite', name='nosetests',
+                           **dict((k, str(v)) for k, v in counts.items()))
+        for classname, test in cases:
+            ET.SubElement(suite, 'testcase', classname=classname, name=test,
+                          time='1.5')
+        ET.ElementTree(suite).write(path)
+        return path
+
+    def test_merges_reports(self):
+        first = self._report('mdts1.xml', [('test_a', 't1'), ('test_a', 't2')],
+                             tests=2, errors=0, failures=1, skip=0)
+        second = self._report('mdts2.xml', [('test_b', 't1')],
+                              tests=1, errors=1, failures=0, skip=0)
+        merged_file = os.path.join(self._dir, 'nosetests.xml')
+        merged = parallel_runner.merge_xunit(
+            [('mdts1', first, 1), ('mdts2', second, 1)], merged_file)
+
+        self.assertEqual(['t1', 't2', 't1'],
+                         [case.get('name') for case in merged])
+        suite = ET.parse(merged_file).getroot()
+        self.assertEqual('3', suite.get('tests'))
+        self.assertEqual('1', suite.get('errors'))
+        self.assertEqual('1', suite.get('failures'))
+
+    def test_missing_report_is_an_error(self):
+        missing = os.path.join(self._dir, 'mdts2.xml')
+        merged = parallel_runner.merge_xunit(
+            [('mdts2', missing, 2)], os.path.join(self._dir, 'out.xml'))
+        self.assertEqual(['mdts2'], [case.get('name') for case in merged])
+        self.assertEqual('1', merged.get('errors'))
+        self.assertEqual('1', merged.get('tests'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,6 +14,7 @@
 # limitations under the License.
 #
 
+import collections
 import logging
 from mdts.utils import conf
 import paramiko
@@ -21,10 +22,18 @@ from paramiko.client import AutoAddPolicy
 from paramiko.config import SSHConfig
 
 import socket
+import threading
 import yaml
 
 LOG = logging.getLogger(__name__)
 
+# Interval, in seconds, of the keepalive messages sent over SSH connections
+KEEPALIVE_INTERVAL = 30
+
+# Maximum number of channels open at once over an SSH connection, below the
+# default MaxSessions (10) of sshd
+MAX_CHANNELS_PER_CONNECTION = 8
+
 
 # This class is intended as a drop-in replacement for the docker.Client
 # class to allow executing commands through SSH instead of using Docker
@@ -56,6 +65,33 @@ LOG = logging.getLogger(__name__)
 # options defined there in case no other value has been passed (note: not all
 # options are used by SSH client, only the previous ones listed)
 #
+# SSH connections are shared by all the containers on the same host with the
+# same credentials. Commands run on channels of their own over them, so they
+# can run concurrently. Up to MAX_CHANNELS_PER_CONNECTION channels are open
+# over a connection, another connection to the host being opened when all are
+# full, or when the host refuses to open more sessions. Connections send
+# keepalives, and are reopened when found closed.
+#
+
+class _Connection(object):
+    """SSH connection, and the channels open over it"""
+
+    def __init__(self, client):
+        self.client = client
+        self.channels = []
+        self.max_channels = MAX_CHANNELS_PER_CONNECTION
+
+    def is_active(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def open_channels(self):
+        self.channels = [c for c in self.channels if not c.closed]
+        return len(self.channels)
+
+    def is_full(self):
+        return self.open_channels() >= self.max_channels
+
 
 class SshClient(object):
 
@@ -108,8 +144,15 @@ class SshClient(object):
             self._containers.append(container)
 
         self.next_exec_id = 0
-        self.ssh_connections = {}
+        # (host address, port, user, password, identity file) -> list of
+        # _Connection
+        self.ssh_connections = collections.defaultdict(list)
         self.execs = {}
+        self._lock = threading.Lock()
+        # connection key -> lock held while opening channels or connecting
+        self._connection_locks = collections.defaultdict(threading.Lock)
+        # container name -> connection key
+        self._connection_keys = {}
 
     def inspect_container(self, container_id):
         for container in self._containers:
@@ -135,20 +178,23 @@ class SshClient(object):
                     stderr=True,
                     tty=False):
         LOG.info("Running command %s at container %s " % (cmd, container_name))
-        exec_id = self.next_exec_id
-        self.next_exec_id += 1
+        with self._lock:
+            exec_id = self.next_exec_id
+            self.next_exec_id += 1
         self.execs[exec_id] = (container_name, cmd, None, None)
         return exec_id
 
     def exec_start(self, exec_id, detach=False, stream=False):
         container_name, cmd, stdout, stderr = self.execs[exec_id]
-        ssh_connection = self._get_ssh_connection(container_name)
-        stdin, stdout, stderr = ssh_connection.exec_command(cmd)
+        stdin, stdout, stderr = self._exec_command(container_name, cmd)
         if stream:
             self.execs[exec_id] = (container_name, cmd, stdout, stderr)
             return stdout
         else:
-            return ''.join(stdout.readlines())
+            output = ''.join(stdout.readlines())
+            # Free the channel for other commands
+            stdout.channel.close()
+            return output
 
     def exec_inspect(self, exec_id, detach=False, stream=False):
         container_name, cmd, stdout, stderr = self.execs[exec_id]
@@ -196,10 +242,71 @@ class SshClient(object):
         return self._get_option(container_config, 'UserKnownHostsFile',
                                 'userknownhostsfile', '/dev/null')
 
-    def _get_ssh_connection(self, container_name):
-        if container_name in self.ssh_connections:
-            return self.ssh_connections[container_name]
-
+    def _get_connection_key(self, container_name):
+        key = self._connection_keys.get(container_name)
+        if key is None:
+            config = self.get_container_by_name(container_name)['Config']
+            key = (self._get_hostname_option(config),
+                   self._get_port_option(config),
+                   self._get_user_option(config),
+                   self._get_password_option(config),
+                   self._get_identity_file_option(config))
+            self._connection_keys[container_name] = key
+        return key
+
+    def _exec_command(self, container_name, cmd):
+        """Runs a command on a channel of its own, over a connection to the
+        host of the container with a channel available
+        """
+        key = self._get_connection_key(container_name)
+        with self._lock:
+            connection_lock = self._connection_locks[key]
+
+        # Channels to different hosts are opened concurrently
+        with connection_lock:
+            connection = self._get_ssh_connection(container_name, key)
+            try:
+                result = connection.client.exec_command(cmd)
+            except paramiko.ChannelException as e:
+                # The host refused another session (e.g. MaxSessions), use
+                # another connection
+                LOG.info("Cannot open more than %d channels to %s:%d as %s, "
+                         "opening another connection: %s" % (
+                             (connection.open_channels(),) + key[:3] + (e,)))
+                connection.max_channels = connection.open_channels()
+                connection = self._get_ssh_connection(container_name, key)
+                result = connection.client.exec_command(cmd)
+            except (paramiko.SSHException, socket.error) as e:
+                # The connection may have dropped since last checked, retry
+                # once on a new one
+                if connection.is_active():
+                    raise
+                LOG.warn("Error running command %s at container %s, "
+                         "reconnecting: %s" % (cmd, container_name, e))
+                connection = self._get_ssh_connection(container_name, key)
+                result = connection.client.exec_command(cmd)
+            connection.channels.append(result[1].channel)
+        return result
+
+    def _get_ssh_connection(self, container_name, key):
+        """Returns a connection with a channel available, opening a new one
+        if needed. Must be called with the lock of the connection key held.
+        """
+        connections = self.ssh_connections[key]
+        for connection in list(connections):
+            if not connection.is_active():
+                LOG.info("SSH connection to %s:%d as %s closed" % key[:3])
+                connection.client.close()
+                connections.remove(connection)
+            elif not connection.is_full():
+                return connection
+        LOG.info("Opening SSH connection %d to %s:%d as %s" % (
+            (len(connections) + 1,) + key[:3]))
+        connection = _Connection(self._connect(container_name))
+        connections.append(connection)
+        return connection
+
+    def _connect(self, container_name):
         config = self.get_container_by_name(container_name)['Config']
         ssh_connection = paramiko.SSHClient()
         ssh_connection.load_system_host_keys()
@@ -218,5 +325,5 @@ class SshClient(object):
             raise Exception("AuthenticationException while trying to " +
                             ("connect to %s container: %s with config %s" %
                             (container_name, container_name, config)))
-        self.ssh_connections[container_name] = ssh_connection
-        return self.ssh_connections[container_name]
+        ssh_connection.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+        return ssh_connection
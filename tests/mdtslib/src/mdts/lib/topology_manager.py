@@ -16,12 +16,115 @@
 
 import fixtures
 from fixtures import callmany
+import functools
+import logging
+import sys
+from testtools.compat import reraise
 import uuid
 import yaml
 
+from mdts.lib.dependency_graph import DependencyGraph
 from mdts.services import service
 from mdts.utils import utils
 
+LOG = logging.getLogger(__name__)
+
+# Maximum number of cleanups running at once on destroy
+CLEANUP_WORKERS = 8
+
+
+class ResourceCleanups(callmany.CallMany):
+    """
+    Stack of cleanup functions which, unlike CallMany, runs the deletions of
+    unrelated resources concurrently.
+
+    Cleanups pushed with push_resource declare the resource they delete and
+    the ids it refers to (e.g. the network of a port). Such a cleanup runs
+    once the cleanups pushed after it that delete a resource referring to its
+    resource are done. Cleanups pushed with push declare nothing, so they keep
+    their place in the LIFO order: they run after all the cleanups pushed
+    after them, and before all the cleanups pushed before them.
+
+    As with CallMany, all the cleanups run, even if some of them fail.
+    """
+
+    def __init__(self):
+        super(ResourceCleanups, self).__init__()
+        # (resource id, set of referenced ids), or None, for each cleanup
+        self._resource_refs = []
+
+    def push(self, cleanup, *args, **kwargs):
+        super(ResourceCleanups, self).push(cleanup, *args, **kwargs)
+        self._resource_refs.append(None)
+
+    def push_resource(self, resource_id, references, cleanup,
+                      *args, **kwargs):
+        """Add a function deleting a resource to be called from __call__.
+
+        :param resource_id: id of the resource deleted by the cleanup, None
+                            if it deletes no resource referred to by others.
+        :param references: ids of the resources the resource refers to.
+        :param cleanup: A callable to call during cleanUp.
+        """
+        super(ResourceCleanups, self).push(cleanup, *args, **kwargs)
+        self._resource_refs.append((resource_id, set(references)))
+
+    def graph(self, call=None):
+        """Returns the dependency graph of the cleanups, keyed by their
+        position in the order they run in CallMany.
+
+        :param call: function calling a cleanup, given the cleanup and its
+                     arguments.
+        """
+        call = call or (lambda cleanup, args, kwargs: cleanup(*args, **kwargs))
+        cleanups = list(zip(self._cleanups, self._resource_refs))[::-1]
+        graph = DependencyGraph()
+        # Last cleanup pushed with push, and resource cleanups run after it
+        barrier = []
+        since_barrier = []
+        for i, ((cleanup, args, kwargs), refs) in enumerate(cleanups):
+            if refs is None:
+                depends_on = barrier + since_barrier
+                barrier = [i]
+                since_barrier = []
+            else:
+                resource_id = refs[0]
+                depends_on = barrier + [
+                    j for j in since_barrier
+                    if resource_id is not None and
+                    resource_id in cleanups[j][1][1]]
+                since_barrier.append(i)
+            graph.add(i, functools.partial(call, cleanup, args, kwargs),
+                      depends_on)
+        return graph
+
+    def __call__(self, raise_errors=True):
+        """Run all the registered functions, concurrently where possible.
+
+        Errors are handled as in CallMany.
+        """
+        result = []
+
+        def call(cleanup, args, kwargs):
+            try:
+                cleanup(*args, **kwargs)
+            except Exception:
+                LOG.warn("Cleanup %s failed" % cleanup, exc_info=True)
+                result.append(sys.exc_info())
+
+        graph = self.graph(call)
+        self._cleanups = []
+        self._resource_refs = []
+        graph.run(max_workers=CLEANUP_WORKERS)
+        if result and raise_errors:
+            if 1 == len(result):
+                error = result[0]
+                reraise(error[0], error[1], error[2])
+            else:
+                raise callmany.MultipleExceptions(*result)
+        if not raise_errors:
+            return result
+
 
 class TopologyManager(fixtures.Fixture):
 
@@ -32,8 +135,8 @@ class TopologyManager(fixtures.Fixture):
         self._midonet_api_host = service.get_container_by_hostname('cluster1')
 
         # New model
-        self._midonet_api = utils.get_midonet_api()
-        self._cleanups = callmany.CallMany()
+        self._midonet_api = midonet_api or utils.get_midonet_api()
+        self._cleanups = ResourceCleanups()
         self._resources = {}
 
     #Deprecate
@@ -72,7 +175,9 @@ class TopologyManager(fixtures.Fixture):
         """
         Builds the topology specified in this method, either physical or
         virtual. If the topology elements should be removed during teardown,
-        you MUST schedule the delete using self.addCleanup(delete_method, args).
+        you MUST schedule the delete using self.addCleanup(delete_method, args)
+        or, for a resource that other resources may refer to,
+        self.add_resource_cleanup(id, references, delete_method, args).
         :rtype: None
         """
         # Do nothing by default
@@ -86,9 +191,28 @@ class TopologyManager(fixtures.Fixture):
         :return:
         """
         self.cleanUp()
-        self._cleanups = callmany.CallMany()
+        self._cleanups = ResourceCleanups()
         self._resources = {}
 
+    def _clear_cleanups(self):
+        super(TopologyManager, self)._clear_cleanups()
+        self._cleanups = ResourceCleanups()
+
+    def add_resource_cleanup(self, resource_id, references, cleanup,
+                             *args, **kwargs):
+        """
+        Schedules the delete of a resource, to run concurrently with the
+        deletes of unrelated resources on destroy.
+
+        :param resource_id: id of the resource, None if no other resource can
+                            refer to it.
+        :param references: ids of the resources it refers to, which are only
+                           deleted after it.
+        :rtype: None
+        """
+        self._cleanups.push_resource(resource_id, references, cleanup,
+                                     *args, **kwargs)
+
     def get_default_tunnel_zone_name(self):
         return 'tzone-%s' % str(uuid.uuid4())[:4]
 
@@ -0,0 +1,78 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit test module for ResourceCleanups.
+"""
+
+from mdts.lib.topology_manager import ResourceCleanups
+
+import threading
+import unittest
+
+
+class ResourceCleanupsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._stack = ResourceCleanups()
+        self._done = []
+        self._lock = threading.Lock()
+
+    def _delete(self, name, error=None):
+        if error:
+            raise error
+        with self._lock:
+            self._done.append(name)
+
+    def _push_topology(self):
+        # Pushed in creation order, run in reverse: p2, p1, vm, iface,
+        # router, subnet, net
+        self._stack.push_resource('net', ['admin'], self._delete, 'net')
+        self._stack.push_resource('subnet', ['net'], self._delete, 'subnet')
+        self._stack.push_resource('router', ['ext'], self._delete, 'router')
+        self._stack.push_resource(None, ['router', 'subnet'], self._delete,
+                                  'iface')
+        self._stack.push(self._delete, 'vm')
+        self._stack.push_resource('p1', ['net'], self._delete, 'p1')
+        self._stack.push_resource('p2', ['net'], self._delete, 'p2')
+
+    def test_graph_levels(self):
+        self._push_topology()
+        self.assertEqual([[0, 1], [2], [3], [4, 5], [6]],
+                         self._stack.graph().levels())
+
+    def test_call_runs_all_cleanups(self):
+        self._push_topology()
+        self._stack()
+        self.assertEqual(['vm', 'iface'], self._done[2:4])
+        self.assertEqual('net', self._done[-1])
+        self.assertEqual(7, len(self._done))
+
+    def test_call_continues_after_error(self):
+        self._stack.push_resource('net', [], self._delete, 'net')
+        self._stack.push_resource('port', ['net'], self._delete, 'port',
+                                  ValueError('port failed'))
+        self.assertRaises(ValueError, self._stack)
+        self.assertEqual(['net'], self._done)
+
+    def test_call_without_raising_errors(self):
+        self._stack.push(self._delete, 'a', ValueError('a failed'))
+        self._stack.push(self._delete, 'b', ValueError('b failed'))
+        errors = self._stack(raise_errors=False)
+        self.assertEqual(2, len(errors))
+        self.assertEqual([], self._done)
+
+
+if __name__ == "__main__":
+    unittest.main()
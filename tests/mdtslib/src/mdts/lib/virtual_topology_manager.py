@@ -16,9 +16,11 @@
 Resource manager for virtual topology data.
 """
 
+import collections
 import logging
 from mdts.lib.bridge import Bridge
 from mdts.lib.chain import Chain
+from mdts.lib.dependency_graph import DependencyGraph
 from mdts.lib.health_monitor import HealthMonitor
 from mdts.lib.link import Link
 from mdts.lib.load_balancer import LoadBalancer
@@ -32,11 +34,20 @@ from mdts.lib.tenants import get_or_create_tenant
 from mdts.lib.topology_manager import TopologyManager
 from mdts.lib.tracerequest import TraceRequest
 from mdts.lib.vtep import Vtep
+from mdts.utils.utils import run_in_parallel
 from midonetclient.api import MidonetApi  # noqa
+import threading
 from webob.exc import HTTPBadRequest
 
 LOG = logging.getLogger(__name__)
 
+# Maximum number of resources created at once when building a topology
+BUILD_WORKERS = 8
+
+# Rule fields referring to device ports or port groups
+_RULE_REFERENCE_FIELDS = ['in_ports', 'out_ports', 'port_group_src',
+                          'target_port']
+
 
 class ResourceNotFoundException(MdtsException):
     """Exception raised when a referred resource is not found."""
@@ -93,60 +104,147 @@ class VirtualTopologyManager(TopologyManager):
 
         self._qos_policies = {}
 
+        self._tenant_id = None
+        self._tenant_lock = threading.Lock()
+
     def build(self, binding_data=None):
         """Generates virtual topology resources (bridges, routers, chains, etc.
         From the data loaded from the input yaml file.
+
+        The resources are created concurrently, each one as soon as the
+        resources it depends on are created.
         """
 
         self._api = self._midonet_api_host.get_midonet_api()
 
+        for link in self._vt.get('links') or []:
+            self.add_link(link['link'])
+
+        self._compile().run(max_workers=BUILD_WORKERS)
+
+        self.resolve_resource_references()
+
+        # Link peer ports
+        run_in_parallel([lambda l=link: self._build_link(l)
+                         for link in self._links],
+                        max_workers=BUILD_WORKERS)
+
+        run_in_parallel([lambda m=mirror: self.add_mirror(m['mirror'])
+                         for mirror in self._vt.get('mirrors') or []],
+                        max_workers=BUILD_WORKERS)
+
+    def _compile(self):
+        """Compiles the virtual topology data into a graph of the resources to
+        create, where each resource depends on the resources it refers to by
+        name.
+        """
+        graph = DependencyGraph()
+        # kind -> name -> key of the task creating that resource
+        names = collections.defaultdict(dict)
+        # kind -> keys of the tasks creating resources of that kind
+        kinds = collections.defaultdict(list)
+
+        def add(kind, add_func, data, depends_on=()):
+            key = (kind, len(graph))
+            graph.add(key, lambda: add_func(data), depends_on)
+            names[kind][data.get('name')] = key
+            kinds[kind].append(key)
+
+        def named(kind, *resource_names):
+            return [names[kind][name] for name in resource_names
+                    if name in names[kind]]
+
+        def devices(*device_names):
+            return named('router', *device_names) + \
+                named('bridge', *device_names)
+
         for qos_policy in self._vt.get('qos_policies') or []:
-            self.add_qos_policy(qos_policy['qos_policy'])
+            add('qos_policy', self.add_qos_policy, qos_policy['qos_policy'])
 
         for health_monitor in self._vt.get('health_monitors') or []:
-            self.add_health_monitor(health_monitor['health_monitor'])
+            add('health_monitor', self.add_health_monitor,
+                health_monitor['health_monitor'])
 
         for load_balancer in self._vt.get('load_balancers') or []:
-            self.add_load_balancer(load_balancer['load_balancer'])
+            data = load_balancer['load_balancer']
+            add('load_balancer', self.add_load_balancer, data,
+                named('health_monitor',
+                      *[pool['pool'].get('health_monitor')
+                        for pool in data.get('pools') or []]))
 
         for router in self._vt.get('routers') or []:
-            self.add_router(router['router'])
+            data = router['router']
+            add('router', self.add_router, data,
+                named('load_balancer', data.get('load_balancer')))
 
         for bridge in self._vt.get('bridges') or []:
-            self.add_bridge(bridge['bridge'])
-
-        for link in self._vt.get('links') or []:
-            self.add_link(link['link'])
+            data = bridge['bridge']
+            add('bridge', self.add_bridge, data,
+                named('qos_policy', data.get('qos_policy'),
+                      *[port['port'].get('qos_policy')
+                        for port in data.get('ports') or []]))
 
         for port_group in self._vt.get('port_groups') or []:
-            self.add_port_group(port_group['port_group'])
-
-        # NOTE: Builds chains after router, bridge, etc. in order to avoid lazy
-        # UUID resolution. The current MidoNet API does not allow an 'update'
-        # operation on chain.
+            data = port_group['port_group']
+            add('port_group', self.add_port_group, data,
+                devices(*[port['port'][0]
+                          for port in data.get('ports') or []]))
+
+        # NOTE: Builds chains after the devices and port groups their rules
+        # refer to, in order to avoid lazy UUID resolution. The current MidoNet
+        # API does not allow an 'update' operation on chain. Jumps to chains
+        # defined later are resolved lazily, as before.
         for chain in self._vt.get('chains') or []:
-            self.add_chain(chain['chain'])
+            data = chain['chain']
+            specs = []
+            jump_chains = []
+            for rule in data.get('rules') or []:
+                rule = rule.get('rule') or {}
+                for field in _RULE_REFERENCE_FIELDS:
+                    spec = rule.get(field)
+                    specs.extend(spec if isinstance(spec, list) else [spec])
+                if 'jump_chain_name' in rule:
+                    jump_chains.append(rule['jump_chain_name'])
+            specs = [spec for spec in specs if isinstance(spec, dict)]
+            add('chain', self.add_chain, data,
+                devices(*[spec.get('device_name') for spec in specs]) +
+                named('port_group',
+                      *[spec.get('port_group_name') for spec in specs]) +
+                named('chain', *jump_chains))
 
         for tracerequest in self._vt.get('tracerequests') or []:
-            self.add_tracerequest(tracerequest['tracerequest'])
+            data = tracerequest['tracerequest']
+            add('tracerequest', self.add_tracerequest, data,
+                devices((data.get('port') or {}).get('device'),
+                        data.get('router'), data.get('bridge')))
+
+        return graph
 
-        referrers = {}
+    def resolve_resource_references(self):
+        """Resolves the references registered while building the topology,
+        and calls update() once on each resource whose references have been
+        resolved. Resources are updated concurrently.
+        """
+        references = collections.OrderedDict()
         for reference in self._resource_references:
-            self.resolve_resource_reference(reference)
-            referrers[reference.get_referrer()] = None
-        # Call update() on resources whose references have been resolved.
-        for referrer in referrers:
+            references.setdefault(reference.get_referrer(), []).append(
+                reference)
+
+        def resolve(referrer, referrer_references):
+            for reference in referrer_references:
+                self.resolve_resource_reference(reference)
             referrer.update()
+
+        run_in_parallel([lambda r=referrer, refs=refs: resolve(r, refs)
+                         for referrer, refs in references.items()],
+                        max_workers=BUILD_WORKERS)
         self._resource_references = []
-        # Link peer ports
-        for link in self._links:
-            try:
-                link.build()
-            except HTTPBadRequest as e:
-                raise DevicePortLinkingException(link, e)
 
-        for mirror in self._vt.get('mirrors') or []:
-            self.add_mirror(mirror['mirror'])
+    def _build_link(self, link):
+        try:
+            link.build()
+        except HTTPBadRequest as e:
+            raise DevicePortLinkingException(link, e)
 
     def look_up_resource(self, referrer, setter, reference_spec):
         """Looks up a resource referred by referrer.
@@ -260,6 +358,13 @@ class VirtualTopologyManager(TopologyManager):
             return None
 
     def get_tenant_id(self):
+        # Resources built concurrently look the tenant up (or create it) once
+        with self._tenant_lock:
+            if self._tenant_id is None:
+                self._tenant_id = self._look_up_tenant_id()
+            return self._tenant_id
+
+    def _look_up_tenant_id(self):
         if self._vt.get('tenant_name'):
             ks_tenant = get_or_create_tenant(self._vt.get('tenant_name'))
             self._vt['tenant_id'] = ks_tenant.id
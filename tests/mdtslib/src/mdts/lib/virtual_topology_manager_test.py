@@ -488,6 +488,30 @@ class VirtualTopologyManagerTest(unittest.TestCase):
                          self._vtm._links[0].get_peer_b_name())
         self.assertEqual(2, self._vtm._links[0].get_peer_b_port_id())
 
+    def test_compile_dependencies(self):
+        """Tests if resources depend on the resources they refer to by name.
+        """
+        self.load_topology_data({'virtual_topology': {
+            'qos_policies': [{'qos_policy': {'name': 'qos-1'}}],
+            'routers': [{'router': {'name': 'router-000-001'}}],
+            'bridges': [{'bridge': {'name': 'bridge-000-001',
+                                    'qos_policy': 'qos-1'}}],
+            'port_groups': [{'port_group': {
+                'name': 'pg-1',
+                'ports': [{'port': ['bridge-000-001', 1]}]}}],
+            'chains': [{'chain': {
+                'name': 'filter-1',
+                'rules': [{'rule': {
+                    'id': 1,
+                    'in_ports': [{'device_name': 'router-000-001',
+                                  'port_id': 1}],
+                    'port_group_src': {'port_group_name': 'pg-1'}}}]}}]}})
+        levels = self._vtm._compile().levels()
+        self.assertEqual([[('qos_policy', 0), ('router', 1)],
+                          [('bridge', 2)],
+                          [('port_group', 3)],
+                          [('chain', 4)]], levels)
+
 
 if __name__ == "__main__":
     original_get_tenant_id = ResourceBase._get_tenant_id
@@ -21,10 +21,33 @@ from mdts.utils.utils import get_neutron_api
 from mdts.utils.utils import http_delete
 from mdts.utils.utils import http_post
 from mdts.utils.utils import http_put
+from neutronclient.common.exceptions import Conflict
 from neutronclient.common.exceptions import NotFound
+import time
 
 LOG = logging.getLogger(__name__)
 
+# Attempts at deleting a resource still in use, e.g. by ports being deleted
+DELETE_ATTEMPTS = 5
+DELETE_RETRY_DELAY = 1
+
+
+def referenced_ids(resource):
+    """
+    Returns the string values of a resource dict, which include the ids of
+    the resources it refers to (e.g. the network and subnets of a port).
+    """
+    if isinstance(resource, dict):
+        resource = resource.values()
+    elif isinstance(resource, basestring):
+        return set([resource])
+    elif not isinstance(resource, (list, tuple)):
+        return set()
+    ids = set()
+    for value in resource:
+        ids.update(referenced_ids(value))
+    return ids
+
 
 class NeutronTopologyManager(TopologyManager):
     """
@@ -75,12 +98,24 @@ class NeutronTopologyManager(TopologyManager):
         delete = getattr(self.api, delete_method_name)
 
         def delete_ignoring_not_found(id):
-            try:
-                delete(id)
-            except NotFound:
-                LOG.warn("%s %s not found during cleanup" % (rtype, id))
-
-        self.addCleanup(delete_ignoring_not_found, resource[rtype]['id'])
+            for attempt in range(DELETE_ATTEMPTS):
+                try:
+                    delete(id)
+                    return
+                except NotFound:
+                    LOG.warn("%s %s not found during cleanup" % (rtype, id))
+                    return
+                except Conflict:
+                    if attempt == DELETE_ATTEMPTS - 1:
+                        raise
+                    LOG.warn("%s %s still in use during cleanup, retrying" %
+                             (rtype, id))
+                    time.sleep(DELETE_RETRY_DELAY)
+
+        self.add_resource_cleanup(resource[rtype]['id'],
+                                  referenced_ids(resource[rtype]),
+                                  delete_ignoring_not_found,
+                                  resource[rtype]['id'])
 
         return resource
 
@@ -100,7 +135,10 @@ class NeutronTopologyManager(TopologyManager):
         post_ret = http_post(
             url, speaker_data, token=self.api.httpclient.auth_token)
         speaker = json.loads(post_ret)
-        self.addCleanup(self.delete_bgp_speaker, speaker['bgp_speaker']['id'])
+        self.add_resource_cleanup(speaker['bgp_speaker']['id'],
+                                  referenced_ids(speaker['bgp_speaker']),
+                                  self.delete_bgp_speaker,
+                                  speaker['bgp_speaker']['id'])
         return speaker['bgp_speaker']
 
     def delete_bgp_peer(self, bgp_peer_id):
@@ -120,7 +158,9 @@ class NeutronTopologyManager(TopologyManager):
             url, peer_data, token=self.api.httpclient.auth_token)
 
         peer = json.loads(post_ret)
-        self.addCleanup(self.delete_bgp_peer, peer['bgp_peer']['id'])
+        self.add_resource_cleanup(peer['bgp_peer']['id'],
+                                  referenced_ids(peer['bgp_peer']),
+                                  self.delete_bgp_peer, peer['bgp_peer']['id'])
 
         return peer['bgp_peer']
 
@@ -158,7 +198,10 @@ class NeutronTopologyManager(TopologyManager):
             url, gw_data, token=self.api.httpclient.auth_token)
         gw = json.loads(post_ret)
 
-        self.addCleanup(self.delete_gateway_device, gw['gateway_device']['id'])
+        self.add_resource_cleanup(gw['gateway_device']['id'],
+                                  referenced_ids(gw['gateway_device']),
+                                  self.delete_gateway_device,
+                                  gw['gateway_device']['id'])
 
         return gw['gateway_device']
 
@@ -177,7 +220,10 @@ class NeutronTopologyManager(TopologyManager):
             url, l2gw_data, token=self.api.httpclient.auth_token)
         l2gw = json.loads(post_ret)
 
-        self.addCleanup(self.delete_l2_gateway, l2gw['l2_gateway']['id'])
+        self.add_resource_cleanup(l2gw['l2_gateway']['id'],
+                                  referenced_ids(l2gw['l2_gateway']),
+                                  self.delete_l2_gateway,
+                                  l2gw['l2_gateway']['id'])
 
         return l2gw['l2_gateway']
 
@@ -198,8 +244,11 @@ class NeutronTopologyManager(TopologyManager):
 
         l2gw_conn = json.loads(post_ret)
 
-        self.addCleanup(self.delete_l2_gateway_connection,
-                        l2gw_conn['l2_gateway_connection']['id'])
+        self.add_resource_cleanup(
+            l2gw_conn['l2_gateway_connection']['id'],
+            referenced_ids(l2gw_conn['l2_gateway_connection']),
+            self.delete_l2_gateway_connection,
+            l2gw_conn['l2_gateway_connection']['id'])
 
         return l2gw_conn["l2_gateway_connection"]
 
@@ -222,8 +271,9 @@ class NeutronTopologyManager(TopologyManager):
 
         rme = json.loads(post_ret)
 
-        self.addCleanup(self.delete_remote_mac_entry, gwdev_id,
-                        rme['remote_mac_entry']['id'])
+        self.add_resource_cleanup(rme['remote_mac_entry']['id'], [gwdev_id],
+                                  self.delete_remote_mac_entry, gwdev_id,
+                                  rme['remote_mac_entry']['id'])
 
         return rme['remote_mac_entry']
 
@@ -268,31 +318,38 @@ class NeutronTopologyManager(TopologyManager):
                 {'router': {
                     'routes': [{'nexthop': nexthop,
                         'destination': cidr}]}})
-        self.addCleanup(self.api.update_router, router_id,
-                        {'router': {'routes': []}})
+        self.add_resource_cleanup(None, [router_id], self.api.update_router,
+                                  router_id, {'router': {'routes': []}})
 
     def set_router_gateway(self, router, network, enable_snat=True):
-        self.api.update_router(router['id'],
-                               {'router': {
-                                   'external_gateway_info': {
-                                       'network_id': network['id'],
-                                       'enable_snat': enable_snat
-                                    }
-                                }})
+        updated = self.api.update_router(router['id'],
+                                         {'router': {
+                                             'external_gateway_info': {
+                                                 'network_id': network['id'],
+                                                 'enable_snat': enable_snat
+                                              }
+                                          }})
+        # The gateway port is on the network and its subnets, which can only
+        # be deleted once the gateway is cleared
+        self.add_resource_cleanup(None, referenced_ids(updated['router']),
+                                  self.api.update_router, router['id'],
+                                  {'router': {'external_gateway_info': {}}})
 
     def add_router_interface(self, router, subnet=None, port=None):
         if subnet is not None:
             self.api.add_interface_router(
                 router['id'], {'subnet_id': subnet['id']})
-            self.addCleanup(self.api.remove_interface_router,
-                            router['id'],
-                            {'subnet_id': subnet['id']})
+            self.add_resource_cleanup(None, [router['id'], subnet['id']],
+                                      self.api.remove_interface_router,
+                                      router['id'],
+                                      {'subnet_id': subnet['id']})
         elif port is not None:
             self.api.add_interface_router(
                 router['id'], {'port_id': port['id']})
-            self.addCleanup(self.api.remove_interface_router,
-                            router['id'],
-                            {'port_id': port['id']})
+            self.add_resource_cleanup(None, [router['id'], port['id']],
+                                      self.api.remove_interface_router,
+                                      router['id'],
+                                      {'port_id': port['id']})
 
     def create_port(self, name, network, host_id=None, interface=None,
                     fixed_ips=[], port_security_enabled=False, mac=None,
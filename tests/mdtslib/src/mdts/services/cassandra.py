@@ -19,8 +19,8 @@ from mdts.services.service import Service
 
 class CassandraHost(Service):
 
-    def __init__(self, container_id):
-        super(CassandraHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(CassandraHost, self).__init__(container_id, registry)
 
     def get_service_status(self):
         result = self.exec_command("nodetool -h localhost status")
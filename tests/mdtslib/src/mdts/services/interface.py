@@ -16,6 +16,8 @@ from concurrent.futures import ThreadPoolExecutor
 from hamcrest import assert_that
 import logging
 from math import ceil
+import pipes
+from threading import Lock
 from threading import Semaphore
 import time
 
@@ -23,6 +25,16 @@ EXECUTOR = ThreadPoolExecutor(max_workers=10)
 
 LOG = logging.getLogger(__name__)
 
+# Size (in millions of bytes) and number of the files of the ring buffer
+# where the packets captured on an interface are written. Only the files
+# written to since an expect started are read, so small files keep the cost
+# of each read independent of how long the interface has been captured.
+CAPTURE_FILE_SIZE = 1
+CAPTURE_FILE_COUNT = 10
+
+# Maximum interval between two reads of the captured packets while expecting
+CAPTURE_POLL_INTERVAL = 0.5
+
 
 class Interface(object):
 
@@ -54,18 +66,16 @@ class Interface(object):
         }
         self._tcpdump_sem = Semaphore(value=0)
         self._tcpdump_output = []
-        # TODO: write all tcpdump output to a file for later inspection
-        #self._tcpdump_output = ''
-        #f = self.expect('', store_output=True)
-        #LOG.debug('Scheduled tcpdump matching all on interface %s' % (ifname))
-        #self._tcpdump_sem.acquire()
+        # listened interface name -> (tcpdump pid, file) of the packet capture
+        self._captures = {}
+        self._captures_lock = Lock()
 
     def destroy(self):
         '''
-        By default don't do anything when destroying. If specific cleaning
-        is necessary, it can be done in the subclass.
+        By default only stop the packet captures when destroying. If specific
+        cleaning is necessary, it can be done in the subclass.
         '''
-        pass
+        self.stop_captures()
 
     def handle_sync(funk):
         def wrapped(self, *args, **kwargs):
@@ -89,12 +99,85 @@ class Interface(object):
     def clear_arp(self, sync=False):
         return EXECUTOR.submit(self.do_clear_arp)
 
+    def _start_capture(self, listen_host_interface):
+        """
+        Starts, unless it is already running, a tcpdump writing the packets
+        of the interface to a ring buffer of files on the compute host.
+        tcpdump runs in the background, so it doesn't keep an exec (an SSH
+        session when running against real hosts) open.
+
+        Returns the path of the capture files, None if tcpdump couldn't start
+        (e.g. because the interface is down).
+        """
+        listen_ifname = self.get_ifname() \
+            if not listen_host_interface \
+            else self.get_binding_ifname()
+        with self._captures_lock:
+            if listen_ifname in self._captures:
+                pid, path = self._captures[listen_ifname]
+                if self.compute_host.exec_command(
+                        'sh -c "kill -0 %d 2>/dev/null && echo running"' %
+                        pid) == 'running':
+                    return path
+                LOG.debug('Capture on %s stopped, restarting it' %
+                          listen_ifname)
+                del self._captures[listen_ifname]
+
+            path = '/tmp/mdts-capture-%s.pcap' % listen_ifname
+            self.compute_host.exec_command('sh -c "rm -f %s*"' % path)
+            cmdline = 'tcpdump -n -U -Z root -i %s -C %d -W %d -w %s' % (
+                listen_ifname,
+                CAPTURE_FILE_SIZE,
+                CAPTURE_FILE_COUNT,
+                path)
+            # Only print the pid if tcpdump is still running after a while
+            script = 'nohup %s >/dev/null 2>&1 & pid=$!; sleep 0.5; ' \
+                     'kill -0 $pid 2>/dev/null && echo $pid' % cmdline
+            pid = self.do_execute('sh -c %s' % pipes.quote(script),
+                                  on_netns=not listen_host_interface)
+            if not pid:
+                LOG.debug('tcpdump failed to start for some reason, '
+                          'probably because interface was down.'
+                          'We are not going to see any packet! %s', cmdline)
+                return None
+            LOG.debug('running tcp dump=%s', cmdline)
+            self._captures[listen_ifname] = (int(pid), path)
+            return path
+
+    def stop_captures(self):
+        with self._captures_lock:
+            if self._captures:
+                self.compute_host.exec_script(
+                    ['kill %d' % pid for pid, _ in self._captures.values()] +
+                    ['rm -f %s*' % path
+                     for _, path in self._captures.values()])
+            self._captures = {}
+
+    def _read_capture(self, path, pcap_filter_string, since):
+        """
+        Returns the tcpdump output lines of the captured packets matching the
+        filter, with a timestamp not older than `since`.
+
+        The packets are filtered on the compute host: only the capture files
+        modified after `since` are read, and only the matching packets
+        captured after `since` are sent back.
+        """
+        script = 'for f in $(find %s* -newermt @%f 2>/dev/null); do ' \
+                 'tcpdump -n -tt -r "$f" %s 2>/dev/null; done | ' \
+                 'awk -v since=%f \'$1 >= since\'' % (
+                     path, since, pipes.quote(pcap_filter_string), since)
+        output = self.compute_host.exec_command(
+            'sh -c %s' % pipes.quote(script))
+        return [line for line in output.splitlines() if line]
+
     # FIXME: the default number of packets to wait for is 1, should be configurable
     def do_expect(self, pcap_filter_string, timeout=None, count=1, listen_host_interface=False):
         """
         Expects packet with pcap_filter_string with tcpdump.
         See man pcap-filter for more details as to what you can match.
 
+        The packets are captured by a tcpdump running for the whole life of
+        the interface, only the packets captured after this call are matched.
 
         Args:
             pcap_filter_string: capture filter to pass to tcpdump
@@ -105,56 +188,34 @@ class Interface(object):
             True: when packet arrives
             False: when packet doesn't arrive within timeout
         """
-        listen_ifname = self.get_ifname() \
-            if not listen_host_interface \
-            else self.get_binding_ifname()
-        cmdline = 'tcpdump -n -l -i %s %s %s' % (
-            listen_ifname,
-            '-c %s' % count,
-            pcap_filter_string)
-        log_stream, exec_id = self.do_execute(cmdline,
-                                              timeout,
-                                              stream=True,
-                                              on_netns=not listen_host_interface)
         try:
-            self.compute_host.ensure_command_running(exec_id)
-            LOG.debug('running tcp dump=%s', cmdline)
-        except Exception:
-            LOG.debug('tcpdump failed to start for some reason, '
-                      'probably because interface was down.'
-                      'We are not going to see any packet! %s', cmdline)
-            self._tcpdump_sem.release()
-        else:
+            path = self._start_capture(listen_host_interface)
+            # Packet timestamps are taken from the compute host clock
+            since = float(self.compute_host.exec_command('date +%s.%N'))
+        finally:
             self._tcpdump_sem.release()
-
-        try:
-            LOG.debug('tcp dump running OK')
-            # FIXME: wrap it in a function so we don't access members directly
-            LOG.debug('Gathering results from stream of %s...' % cmdline)
-            result = ""
-            for log_line in log_stream:
-                result += log_line
-                self._tcpdump_output.append(log_line)
-                LOG.debug('Result is: %s' % log_line.rstrip())
-            LOG.debug('Result output is : %s' % result)
-        except StopIteration:
-            LOG.debug("Stream didn't block, command %s " % cmdline +
-                      " timed out before pulling results.")
-
-        return_code = self.compute_host.check_exit_status(exec_id)
-        if return_code != 0:
-            LOG.debug('%s return_code = %s != 0, no packets received... %r' % (
-                cmdline,
-                return_code,
-                result
-            ))
+        if path is None:
             return False
 
-        LOG.debug('%s return_code = %s output = %r' % (
-            cmdline,
-            return_code,
-            result))
-        return True
+        deadline = time.time() + timeout if timeout else None
+        interval = 0.05
+        while True:
+            packets = self._read_capture(path, pcap_filter_string, since)
+            if len(packets) >= count:
+                self._tcpdump_output.extend(packets[:count])
+                LOG.debug('Filter %s matched on %s: %r' % (
+                    pcap_filter_string, path, packets[:count]))
+                return True
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                self._tcpdump_output.extend(packets)
+                LOG.debug('Filter %s matched %d packets on %s out of %d '
+                          'expected: %r' % (pcap_filter_string, len(packets),
+                                            path, count, packets))
+                return False
+            time.sleep(interval if deadline is None
+                       else min(interval, deadline - now))
+            interval = min(interval * 2, CAPTURE_POLL_INTERVAL)
 
     # Inherited methods
     # FIXME: remove sync or look where it is used
@@ -19,8 +19,8 @@ from mdts.services.service import Service
 
 
 class JmxTransHost(Service):
-    def __init__(self, container_id):
-        super(JmxTransHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(JmxTransHost, self).__init__(container_id, registry)
 
     def _get_remote_config_file(self, jobname):
         return "/var/lib/jmxtrans/%s.json" % jobname
@@ -21,8 +21,8 @@ from keystoneclient.v2_0 import client
 
 class KeystoneHost(Service):
 
-    def __init__(self, container_id):
-        super(KeystoneHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(KeystoneHost, self).__init__(container_id, registry)
 
     def get_service_name(self):
         return 'keystone'
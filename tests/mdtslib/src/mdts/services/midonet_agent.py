@@ -17,7 +17,6 @@ import logging
 from mdts.lib.bindings import BindingType
 from mdts.services.interface import Interface
 from mdts.services.jmx_monitor import JMXMonitor
-from mdts.services import service
 from mdts.services.service import Service
 from mdts.services.vmguest import VMGuest
 import random
@@ -28,32 +27,28 @@ LOG = logging.getLogger(__name__)
 
 class MidonetAgentHost(Service):
 
-    def __init__(self, container_id):
-        super(MidonetAgentHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(MidonetAgentHost, self).__init__(container_id, registry)
         self.compute_num = int(self.get_hostname().split('midolman')[1])
-        self.api = None
         self.midonet_host_id = None
         self.num_interfaces = 0
 
     def get_api(self):
-        if not self.api:
-            self.api = service.get_container_by_hostname('cluster1').\
-                get_midonet_api(timeout=120)
-        return self.api
+        return self.registry.get_container_by_hostname('cluster1').\
+            get_midonet_api(timeout=120)
 
     def get_service_status(self):
         try:
-            hosts = self.get_api().get_hosts()
             midonet_host_id = self.get_midonet_host_id()
-            for h in hosts:
-                if h.get_id() == midonet_host_id:
-                    LOG.debug('Host %s found! is alive? %s' % (
-                        midonet_host_id,
-                        h.is_alive()
-                    ))
-                    return 'up' if h.is_alive() else 'down'
-            LOG.error('Host %s not found.' % midonet_host_id)
-            return 'down'
+            h = self.get_api().get_host(midonet_host_id)
+            if h is None:
+                LOG.error('Host %s not found.' % midonet_host_id)
+                return 'down'
+            LOG.debug('Host %s found! is alive? %s' % (
+                midonet_host_id,
+                h.is_alive()
+            ))
+            return 'up' if h.is_alive() else 'down'
         except Exception:
             return 'down'
 
@@ -127,19 +122,18 @@ class MidonetAgentHost(Service):
         self.exec_command('ip netns exec del %s' % name)
 
     def create_netns_router(self, name, bindings):
-        self.exec_command('ip netns add %s' % name)
-        self.exec_command('ip netns exec %s ip link set lo up' % name)
+        commands = ['ip netns add %s' % name,
+                    'ip netns exec %s ip link set lo up' % name]
         for binding in bindings:
-            self.exec_command(
+            commands += [
                 'ip link add dev %s type veth peer name p%s' %
-                (binding['iface'], binding['iface']))
-            self.exec_command('ip link set p%s up' % binding['iface'])
-            self.exec_command('ip link set %s up' % binding['iface'])
-            self.exec_command('ip link set dev p%s up netns %s' %
-                              (binding['iface'], name))
-            self.exec_command(
+                (binding['iface'], binding['iface']),
+                'ip link set p%s up' % binding['iface'],
+                'ip link set %s up' % binding['iface'],
+                'ip link set dev p%s up netns %s' % (binding['iface'], name),
                 'ip netns exec %s ip addr add %s dev p%s' %
-                (name, binding['addr'], binding['iface']))
+                (name, binding['addr'], binding['iface'])]
+        self.exec_script(commands)
 
     def create_vmguest(self, **iface_kwargs):
         """
@@ -156,15 +150,6 @@ class MidonetAgentHost(Service):
         else:
             vm_id = iface_kwargs['ifname']
 
-        self.exec_command(
-            'ip link add dev veth%s type veth peer name peth%s' % (
-                vm_id, vm_id))
-
-        # Disable ipv6 for the namespace
-
-        self.exec_command('ip netns add vm%s' % vm_id)
-        self.exec_command('ip netns exec vm%s sysctl -w net.ipv6.conf.default.disable_ipv6=1' % vm_id)
-        self.exec_command('ip netns exec vm%s sysctl -w net.ipv6.conf.all.disable_ipv6=1' % vm_id)
         # MAC Address of hosts
         # aa:bb:cc:RR:HH:II where:
         # aa:bb:cc -> constant
@@ -178,20 +163,28 @@ class MidonetAgentHost(Service):
                 self.num_interfaces % 255
             )
 
+        # All the commands run in a single exec
         # FIXME: define veth, peth and vm names consistently and in one place
-        self.exec_command(
+        commands = [
+            'ip link add dev veth%s type veth peer name peth%s' % (
+                vm_id, vm_id),
+            # Disable ipv6 for the namespace
+            'ip netns add vm%s' % vm_id,
+            'ip netns exec vm%s sysctl -w '
+            'net.ipv6.conf.default.disable_ipv6=1' % vm_id,
+            'ip netns exec vm%s sysctl -w '
+            'net.ipv6.conf.all.disable_ipv6=1' % vm_id,
             'ip link set address %s dev peth%s' % (
                 iface_kwargs['hw_addr'],
-                vm_id))
-        # set veth up
-        self.exec_command('ip link set veth%s up' % vm_id)
-        self.exec_command('ip link set dev peth%s up netns vm%s' %
-                          (vm_id, vm_id))
+                vm_id),
+            # set veth up
+            'ip link set veth%s up' % vm_id,
+            'ip link set dev peth%s up netns vm%s' % (vm_id, vm_id)]
 
         # FIXME: move it to guest?
         # FIXME: hack for the yaml physical topology definition, fix it
         if 'ipv4_addr' in iface_kwargs and len(iface_kwargs['ipv4_addr']) > 0:
-            self.exec_command(
+            commands.append(
                 'ip netns exec vm%s ip addr add %s dev peth%s' % (
                     vm_id,
                     iface_kwargs['ipv4_addr'][0],
@@ -200,7 +193,7 @@ class MidonetAgentHost(Service):
             )
 
         if 'ipv4_gw' in iface_kwargs:
-            self.exec_command(
+            commands.append(
                 'ip netns exec vm%s ip route add default via %s' % (
                     vm_id,
                     iface_kwargs['ipv4_gw']
@@ -208,7 +201,7 @@ class MidonetAgentHost(Service):
             )
 
         if 'mtu' in iface_kwargs:
-            self.exec_command(
+            commands.append(
                 'ip netns exec vm%s ip link set mtu %s dev peth%s' % (
                     vm_id,
                     iface_kwargs['mtu'],
@@ -216,16 +209,18 @@ class MidonetAgentHost(Service):
                 )
             )
 
+        self.exec_script(commands)
+
         iface_kwargs['compute_host'] = self
 
         return VMGuest(vm_id, **iface_kwargs)
 
     def destroy_vmguest(self, vm_guest):
-        self.exec_command('ip netns exec vm%s ip link set dev peth%s down' % (
-            vm_guest.get_vm_id(),
-            vm_guest.get_vm_id()
-        ))
-        self.exec_command('ip netns del vm%s' % vm_guest.get_vm_id())
+        self.exec_script([
+            'ip netns exec vm%s ip link set dev peth%s down' % (
+                vm_guest.get_vm_id(),
+                vm_guest.get_vm_id()),
+            'ip netns del vm%s' % vm_guest.get_vm_id()])
 
     def create_trunk(self, **iface_kwargs):
         raise NotImplementedError()
@@ -17,54 +17,98 @@ import logging
 from mdts.services.jmx_monitor import JMXMonitor
 from mdts.services.service import Service
 from midonetclient.api import MidonetApi
+import threading
 import time
 
 LOG = logging.getLogger(__name__)
 
+# Seconds during which the shared API client is used without checking it again
+API_CHECK_INTERVAL = 30
+
 
 class MidonetClusterHost(Service):
-    def __init__(self, container_id):
-        super(MidonetClusterHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(MidonetClusterHost, self).__init__(container_id, registry)
         self.username = 'admin'
         self.password = 'admin'
         self.port = 8181
+        # API client shared by all callers, and last time it was checked
+        self._midonet_api = None
+        self._midonet_api_checked = 0
+        self._midonet_api_lock = threading.Lock()
 
     def get_service_status(self):
         try:
-            self.get_midonet_api().get_hosts()
+            self._check_midonet_api()
             return 'up'
         except Exception:
+            self.reset_midonet_api()
             return 'down'
 
     def get_service_name(self):
         return 'midonet-cluster'
 
+    def manage_service(self, *args, **kwargs):
+        # The API goes away while the cluster restarts, so check it again on
+        # next use
+        self.reset_midonet_api()
+        return super(MidonetClusterHost, self).manage_service(*args, **kwargs)
+
     def get_service_logs(self):
         return ['/var/log/midonet-cluster/midonet-cluster.log']
 
+    def _check_midonet_api(self):
+        """Checks the API with the shared client, created if needed, and keeps
+        the client if the check succeeds
+        """
+        api = self._midonet_api or MidonetApi(
+            "http://%s:%d/midonet-api" % (self.get_ip_address(), self.port),
+            self.username,
+            self.password)
+        # We need to actually ask something to the api to make sure
+        # that the compat api is actually talking to the NSDB
+        api.get_hosts()
+        with self._midonet_api_lock:
+            self._midonet_api = api
+            self._midonet_api_checked = time.time()
+        return api
+
+    def reset_midonet_api(self):
+        """Drops the shared API client, so that a new one is created and
+        checked on the next call to get_midonet_api
+        """
+        self._midonet_api = None
+
     def get_midonet_api(self, timeout=300):
+        """Returns the API client shared by all callers
+
+        The client is checked before being returned, unless it was checked
+        less than API_CHECK_INTERVAL seconds ago. The check runs outside the
+        lock, so that callers waiting for a slow API each give up after their
+        own timeout.
+        """
         # FIXME: Make sure the API is able to get topology information from ZK
         # ROOT CAUSE: the api does not retry when connected to a ZK instance
         # which just failed
         # WORKAROUND: retry in here, should be FIXED in python-midonetclient?
+        deadline = time.time() + timeout
         wait_time = 1
         while True:
-            if timeout == 0:
-                raise RuntimeError("Timeout waiting for midonet_api")
+            with self._midonet_api_lock:
+                api = self._midonet_api
+                if api is not None and \
+                        time.time() - self._midonet_api_checked < \
+                        API_CHECK_INTERVAL:
+                    return api
             try:
-                api = MidonetApi(
-                    "http://%s:%d/midonet-api" % (self.get_ip_address(),
-                                                  self.port),
-                    self.username,
-                    self.password)
-                # We need to actually ask something to the api to make sure
-                # that the compat api is actually talking to the NSDB
-                api.get_hosts()
-                return api
+                return self._check_midonet_api()
             except Exception, e:
                 LOG.warn("Error getting api, retrying. %s" % e)
-                time.sleep(wait_time)
-                timeout -= wait_time
+                self.reset_midonet_api()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise RuntimeError("Timeout waiting for midonet_api")
+                time.sleep(min(wait_time, remaining))
 
     def get_jmx_monitor(self):
         monitor = JMXMonitor()
@@ -14,7 +14,6 @@
 # limitations under the License.
 #
 
-from mdts.services import service
 from mdts.services.service import Service
 from mdts.utils import conf
 
@@ -23,8 +22,8 @@ import neutronclient.neutron.client as neutron
 
 class NeutronHost(Service):
 
-    def __init__(self, container_id):
-        super(NeutronHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(NeutronHost, self).__init__(container_id, registry)
 
     def get_service_status(self):
         try:
@@ -44,7 +43,7 @@ class NeutronHost(Service):
         """
         :rtype: neutronclient.neutron.client.Client
         """
-        keystone_host = service.get_container_by_hostname('keystone')
+        keystone_host = self.registry.get_container_by_hostname('keystone')
         return neutron.Client(
             '2.0',
             auth_url='http://%s:35357/v2.0' % keystone_host.get_ip_address(),
@@ -19,8 +19,8 @@ from mdts.services.service import Service
 
 class QuaggaHost(Service):
 
-    def __init__(self, container_id):
-        super(QuaggaHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(QuaggaHost, self).__init__(container_id, registry)
 
     def get_service_status(self):
         # FIXME: check how to ensure that the quagga daemon is up
@@ -15,48 +15,63 @@
 #
 
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import importlib
 import logging
 from mdts.lib.mdtsdocker import DockerClient
 from mdts.lib.ssh import SshClient
 from mdts.services.interface import Interface
 from mdts.utils import conf
+import pipes
 import time
 
 LOG = logging.getLogger(__name__)
 
-cli = None
+# Printed with the exit code of each command run by Service.exec_script
+SCRIPT_STEP_MARKER = 'MDTS-SCRIPT-STEP'
 
-if conf.containers_file() is None:
-    print("containers_file not configured -> using Docker API")
-    cli = DockerClient(base_url='unix://var/run/docker.sock',
-                       timeout=conf.docker_http_timeout(),
-                       sandbox_prefix=conf.sandbox_prefix(),
-                       sandbox_name=conf.sandbox_name())
-else:
-    print("containers_file configured as '%s' -> using SSH" %
-          conf.containers_file())
-    cli = SshClient(conf.containers_file(), conf.extra_ssh_config_file())
+
+def create_cli(sandbox_name):
+    """Creates the client to run commands in the containers of a sandbox
+
+    When a containers_file is configured, commands run over SSH on the hosts
+    it lists and the sandbox name is not used.
+    """
+    if conf.containers_file() is None:
+        print("containers_file not configured -> using Docker API")
+        return DockerClient(base_url='unix://var/run/docker.sock',
+                            timeout=conf.docker_http_timeout(),
+                            sandbox_prefix=conf.sandbox_prefix(),
+                            sandbox_name=sandbox_name)
+    else:
+        print("containers_file configured as '%s' -> using SSH" %
+              conf.containers_file())
+        return SshClient(conf.containers_file(), conf.extra_ssh_config_file())
 
 
 class Service(object):
 
-    def __init__(self, container_id):
+    def __init__(self, container_id, registry=None):
+        self.registry = registry or default_registry
+        self.cli = self.registry.cli
         self.container_id = container_id
-        self.info = cli.inspect_container(container_id)
+        self.info = self.cli.inspect_container(container_id)
         timeout = conf.service_status_timeout()
         wait_time = 1
-        # Check first that the container is running
-        while not self.is_container_running():
+        # Check first that the container is running, reusing the info just
+        # fetched before polling
+        running = self.info['State']['Running']
+        while not running:
             if timeout == 0:
                 raise RuntimeError("Container %s: timeout waiting to be running" % (
                     self.get_name()
                 ))
             timeout -= wait_time
             time.sleep(wait_time)
+            running = self.is_container_running()
 
     def _update_container_info(self):
-        self.info = cli.inspect_container(self.container_id)
+        self.info = self.cli.inspect_container(self.container_id)
 
     # Helper methods to abstract from docker internals
     def get_type(self):
@@ -117,9 +132,54 @@ class Service(object):
         return None
 
     def set_log_marker(self, marker):
+        """
+        Appends a marker to the log files of the service, with a single exec.
+
+        :return: dict of log file -> size of the file before the marker, to
+                 read what is logged from then on with write_log
+        """
         logfiles = self.get_service_logs()
-        for logfile in logfiles:
-            self.exec_command("sh -c \"echo '%s' >> %s\"" % (marker, logfile), stream=False)
+        if not logfiles:
+            return {}
+        results = self.exec_script(
+            ["stat -c %%s %s 2>/dev/null || echo 0; echo %s >> %s" % (
+                logfile, pipes.quote(marker), logfile)
+             for logfile in logfiles])
+        offsets = {}
+        for logfile, (_, _, output) in zip(logfiles, results):
+            try:
+                offsets[logfile] = int(output.split()[0])
+            except (IndexError, ValueError):
+                offsets[logfile] = 0
+        return offsets
+
+    def write_log(self, logfile, path, start=0, end=None):
+        """
+        Writes the bytes of a log file between two offsets to a local gzip
+        file. Only those bytes are read, compressed on the service host and
+        streamed to the file. If the log file was rotated in between (it is
+        now smaller than start), the whole file is written.
+
+        :param start: offset of the first byte, as returned by set_log_marker
+        :param end: offset after the last byte, None to read to the end
+        """
+        header = ["-----------------------",
+                  "%s - %s" % (self.get_service_name(), self.get_name()),
+                  logfile,
+                  "-----------------------"]
+        reader = 'cat' if end is None else 'head -c %d' % max(end - start, 0)
+        script = ("{ printf '%%s\\n' %s; "
+                  "s=%d; r=%s; "
+                  "[ \"$(stat -c %%s %s 2>/dev/null || echo 0)\" -ge $s ] || "
+                  "{ s=0; r=cat; }; "
+                  "tail -c +$((s + 1)) %s 2>&1 | $r; } | gzip -c") % (
+            ' '.join(pipes.quote(line) for line in header),
+            start, pipes.quote(reader), logfile, logfile)
+        stream, _ = self.exec_command('sh -c %s' % pipes.quote(script),
+                                      stream=True)
+        with open(path, 'wb') as f:
+            for chunk in stream:
+                f.write(chunk)
 
     def get_test_log(self, start_marker, end_marker):
         logfiles = self.get_service_logs()
@@ -195,12 +255,13 @@ class Service(object):
         :return: the exit code of the return
         """
         LOG.debug('[%s] executing command: %s', self.get_name(), cmd)
-        exec_id = cli.exec_create(self.get_name(),
-                                  cmd,
-                                  stdout=True,
-                                  stderr=False,
-                                  tty=False)
-        outputstream = cli.exec_start(exec_id, detach=False, stream=True)
+        exec_id = self.cli.exec_create(self.get_name(),
+                                       cmd,
+                                       stdout=True,
+                                       stderr=False,
+                                       tty=False)
+        outputstream = self.cli.exec_start(exec_id, detach=False,
+                                           stream=True)
 
         # Result is a data blocking stream, exec_id for future checks
         LOG.debug('[%s] executing command: %s', self.get_name(), cmd)
@@ -210,11 +271,11 @@ class Service(object):
 
 
     def exec_command_and_get_output(self, cmd, timeout=2):
-        exec_id = cli.exec_create(self.get_name(), cmd,
-                                  stdout=True, stderr=False,
-                                  tty=False)
-        output_stream = cli.exec_start(exec_id, detach=False,
-                                       stream=True)
+        exec_id = self.cli.exec_create(self.get_name(), cmd,
+                                       stdout=True, stderr=False,
+                                       tty=False)
+        output_stream = self.cli.exec_start(exec_id, detach=False,
+                                            stream=True)
         status = self.check_exit_status(exec_id, None, timeout)
         if conf.containers_file() is None:
             return (status, ''.join(output_stream))
@@ -238,13 +299,13 @@ class Service(object):
 
         LOG.debug('[%s] executing command: %s', self.get_name(), cmd)
 
-        exec_id = cli.exec_create(self.get_name(),
-                                  cmd,
-                                  stdout=stdout,
-                                  stderr=stderr,
-                                  tty=tty)
+        exec_id = self.cli.exec_create(self.get_name(),
+                                       cmd,
+                                       stdout=stdout,
+                                       stderr=stderr,
+                                       tty=tty)
 
-        result = cli.exec_start(exec_id, detach=detach, stream=stream)
+        result = self.cli.exec_start(exec_id, detach=detach, stream=stream)
         if stream:
             # Result is a data blocking stream, exec_id for future checks
             LOG.debug('[%s] executing command: %s -> stream',
@@ -259,9 +320,53 @@ class Service(object):
                   self.get_name(), cmd, result)
         return result
 
+    def exec_script(self, commands, raise_error=False):
+        """
+        Runs a list of commands one after the other, with a single exec.
+        As with separate exec_command calls, every command runs even if a
+        previous one failed.
+
+        :param commands: list of command lines
+        :param raise_error: whether to raise an error if any command failed
+        :return: list of (command, exit code, output) tuples, one per command
+        """
+        script = '; '.join(
+            '{ %s ; } 2>&1; echo "%s %d $?"' % (cmd, SCRIPT_STEP_MARKER, i)
+            for i, cmd in enumerate(commands))
+        output = self.exec_command('sh -c %s' % pipes.quote(script))
+
+        results = []
+        step_output = []
+        for line in output.splitlines():
+            if line.startswith(SCRIPT_STEP_MARKER):
+                _, step, exit_code = line.split()
+                results.append((commands[int(step)], int(exit_code),
+                                '\n'.join(step_output)))
+                step_output = []
+            else:
+                step_output.append(line)
+
+        failed = [(cmd, exit_code, out) for cmd, exit_code, out in results
+                  if exit_code != 0]
+        for cmd, exit_code, out in failed:
+            LOG.debug('[%s] command %s failed with code %d: %s',
+                      self.get_name(), cmd, exit_code, out)
+        if len(results) < len(commands):
+            failed.append((commands[len(results)], None,
+                           '\n'.join(step_output)))
+            LOG.error('[%s] script interrupted at command %s: %s',
+                      self.get_name(), commands[len(results)],
+                      '\n'.join(step_output))
+        if failed and raise_error:
+            raise RuntimeError('[%s] commands failed: %s' % (
+                self.get_name(),
+                ', '.join('%s (%s)' % (cmd, exit_code)
+                          for cmd, exit_code, _ in failed)))
+        return results
+
     def ensure_command_running(self, exec_id, timeout=20, raise_error=True):
         wait_time = 0.5
-        while not cli.exec_inspect(exec_id)['Running']:
+        while not self.cli.exec_inspect(exec_id)['Running']:
             if timeout == 0:
                 LOG.debug('Command %s did not start' % exec_id)
                 if raise_error:
@@ -275,7 +380,7 @@ class Service(object):
 
     def check_exit_status(self, exec_id, output_stream=None, timeout=20):
         wait_time = 1
-        exec_info = cli.exec_inspect(exec_id)
+        exec_info = self.cli.exec_inspect(exec_id)
         cmdline = exec_info['ProcessConfig']['entrypoint']
         for arg in exec_info['ProcessConfig']['arguments']:
             cmdline += " " + arg
@@ -285,7 +390,7 @@ class Service(object):
             for output in output_stream:
                 LOG.debug("Output: %s" % output)
         # Wait for command to finish after a certain amount of time
-        while cli.exec_inspect(exec_id)['Running']:
+        while self.cli.exec_inspect(exec_id)['Running']:
             if timeout == 0:
                 LOG.debug('Command %s timed out.' % cmdline)
                 raise RuntimeError("Command %s timed out." % cmdline)
@@ -295,7 +400,7 @@ class Service(object):
                 cmdline,
                 timeout
             ))
-        exec_info = cli.exec_inspect(exec_id)
+        exec_info = self.cli.exec_inspect(exec_id)
         LOG.debug('Command %s %s' % (
             cmdline,
             'succeeded' if exec_info['ExitCode'] == 0 else 'failed'
@@ -359,47 +464,119 @@ class Service(object):
         self.exec_command("rm -f %s" % filename)
 
 
-def load_from_id(container_id):
-    container_info = cli.inspect_container(container_id)
-    fqn = container_info['Config']['Labels']['interface']
-    module_name, class_name = tuple(fqn.rsplit('.', 1))
-    _module = importlib.import_module(module_name)
-    _class = getattr(_module, class_name)
-    return _class(container_id)
+class ServiceRegistry(object):
+    """The services of a sandbox, loaded on first lookup
 
-loaded_containers = None
+    Each sandbox has its own registry and client, so that services of several
+    sandboxes can be used at once. The module functions below look up the
+    services of the default registry, i.e. of the sandbox in conf.
+    """
+
+    def __init__(self, cli):
+        self.cli = cli
+        # type -> containers of that type, sorted by hostname
+        self.loaded_containers = None
+        # hostname -> container, built along with loaded_containers
+        self.containers_by_hostname = None
+
+    def reset(self):
+        """Forgets the loaded containers, so that they are loaded again on the
+        next lookup (e.g. after restarting the sandbox)
+        """
+        self.loaded_containers = None
+        self.containers_by_hostname = None
+
+    def load_from_id(self, container_id, labels=None):
+        """Instantiates the service class of a container
+
+        :param labels: labels of the container, as listed by cli.containers(),
+                       to avoid inspecting the container to find its class
+        """
+        if labels is None:
+            labels = self.cli.inspect_container(
+                container_id)['Config']['Labels']
+        fqn = labels['interface']
+        module_name, class_name = tuple(fqn.rsplit('.', 1))
+        _module = importlib.import_module(module_name)
+        _class = getattr(_module, class_name)
+        return _class(container_id, registry=self)
+
+    def _load_containers(self, include_failed=False):
+        """Loads the containers of the sandbox, grouped by type
+
+        The containers are listed at once, then inspected concurrently. The
+        containers of each type are sorted by hostname.
+        """
+        containers = [c for c in self.cli.containers(all=include_failed)
+                      if 'type' in c['Labels']]
+        if not containers:
+            return {}
+        executor = ThreadPoolExecutor(
+            max_workers=min(LOAD_WORKERS, len(containers)))
+        try:
+            instances = list(executor.map(
+                lambda c: self.load_from_id(c['Id'], c['Labels']),
+                containers))
+        finally:
+            executor.shutdown()
+
+        by_type = {}
+        for container, instance in zip(containers, instances):
+            by_type.setdefault(container['Labels']['type'], []).append(
+                instance)
+        for container_list in by_type.values():
+            container_list.sort(key=lambda container: container.get_hostname())
+        return by_type
+
+    def get_all_containers(self, container_type=None, include_failed=False):
+        # Load and cache containers associated with the sandbox, and index
+        # them
+        if not self.loaded_containers:
+            self.loaded_containers = self._load_containers(include_failed)
+            self.containers_by_hostname = dict(
+                (container.get_hostname(), container)
+                for container_list in self.loaded_containers.values()
+                for container in container_list)
+
+        if container_type:
+            if container_type in self.loaded_containers:
+                return self.loaded_containers[container_type]
+            else:
+                return []
+        return self.loaded_containers
+
+    def get_container_by_hostname(self, container_hostname):
+        if not self.loaded_containers:
+            self.get_all_containers()
+        container = self.containers_by_hostname.get(container_hostname)
+        if container is None:
+            raise RuntimeError('Container %s not found or loaded' %
+                               container_hostname)
+        return container
+
+
+# Number of containers inspected concurrently when loading the sandbox
+LOAD_WORKERS = 16
+
+default_registry = ServiceRegistry(create_cli(conf.sandbox_name()))
+cli = default_registry.cli
+
+
+def load_from_id(container_id, labels=None):
+    return default_registry.load_from_id(container_id, labels)
+
+
+def reset_containers():
+    """Forgets the loaded containers, so that they are loaded again on the next
+    lookup (e.g. after restarting the sandbox)
+    """
+    default_registry.reset()
 
 
 def get_container_by_hostname(container_hostname):
-    global loaded_containers
-    if not loaded_containers:
-        loaded_containers = get_all_containers()
-    for type, container_list in loaded_containers.items():
-        for container in container_list:
-            if container.get_hostname() == container_hostname:
-                return container
-    raise RuntimeError('Container %s not found or loaded' % container_hostname)
+    return default_registry.get_container_by_hostname(container_hostname)
 
 
 # FIXME: this factory is not the best option
 def get_all_containers(container_type=None, include_failed=False):
-    global loaded_containers
-
-    # Load and cache containers associated with the sandbox
-    if not loaded_containers:
-        running_containers = cli.containers(all=include_failed)
-        loaded_containers = {}
-        for container in running_containers:
-            if 'type' in container['Labels']:
-                current_type = container['Labels']['type']
-                container_instance = load_from_id(container['Id'])
-                loaded_containers.setdefault(current_type, []).append(container_instance)
-        for type, container_list in loaded_containers.items():
-            sorted(container_list, key=lambda container: container.get_hostname())
-
-    if container_type:
-        if container_type in loaded_containers:
-            return loaded_containers[container_type]
-        else:
-            return []
-    return loaded_containers
+    return default_registry.get_all_containers(container_type, include_failed)
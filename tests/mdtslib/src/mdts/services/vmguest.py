@@ -47,6 +47,7 @@ class VMGuest(Interface):
         self.compute_host.create_vmguest(self)
 
     def destroy(self):
+        self.stop_captures()
         self.exec_command_blocking("dhclient -r")
         self.compute_host.destroy_vmguest(self)
 
@@ -81,6 +82,8 @@ class VMGuest(Interface):
         result = self.compute_host.exec_command(cmdline,
                                                 detach=False,
                                                 stream=stream)
-        # Extra timeout to account for docker exec warmup
-        time.sleep(extra_timeout)
+        # Extra timeout to account for docker exec warmup of commands left
+        # running, synchronous commands are already done
+        if stream:
+            time.sleep(extra_timeout)
         return result
@@ -19,8 +19,8 @@ from mdts.services.service import Service
 
 class VtepHost(Service):
 
-    def __init__(self, container_id):
-        super(VtepHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(VtepHost, self).__init__(container_id, registry)
 
     def get_service_name(self):
         return 'openvswitch-vtep'
@@ -20,8 +20,8 @@ from mdts.services.service import Service
 
 class ZookeeperHost(Service):
 
-    def __init__(self, container_id):
-        super(ZookeeperHost, self).__init__(container_id)
+    def __init__(self, container_id, registry=None):
+        super(ZookeeperHost, self).__init__(container_id, registry)
 
     def get_service_status(self):
         result = self.exec_command("sh -c 'echo stat | nc localhost 2181'")
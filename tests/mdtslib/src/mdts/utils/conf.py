@@ -21,6 +21,7 @@ conf = ConfigParser.ConfigParser()
 conf.read(conf_file)
 
 mdts_sandbox_name = os.getenv('MDTS_SANDBOX_NAME')
+mdts_sandbox_names = os.getenv('MDTS_SANDBOX_NAMES')
 
 
 def is_vxlan_enabled():
@@ -55,6 +56,21 @@ def sandbox_name():
         return conf.get('sandbox', 'sandbox_name')
 
 
+def sandbox_names():
+    """Returns the names of the sandboxes to run the tests on in parallel,
+    from the comma separated list in the MDTS_SANDBOX_NAMES env variable or in
+    the sandbox_names option of mdts.conf. Defaults to the single sandbox
+    returned by sandbox_name().
+    """
+    if mdts_sandbox_names is not None:
+        names = mdts_sandbox_names
+    elif conf.has_option('sandbox', 'sandbox_names'):
+        names = conf.get('sandbox', 'sandbox_names')
+    else:
+        return [sandbox_name()]
+    return [name.strip() for name in names.split(',') if name.strip()]
+
+
 def sandbox_prefix():
     return conf.get('sandbox', 'sandbox_prefix')
 
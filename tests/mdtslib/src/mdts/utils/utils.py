@@ -15,7 +15,9 @@
 """
 Utility functions for functional tests.
 """
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from functools import partial
 from functools import wraps
 import inspect
 import json
@@ -28,6 +30,9 @@ from StringIO import StringIO
 import subprocess
 import tempfile
 import time
+from webob.exc import HTTPConflict
+from webob.exc import HTTPNotFound
+from webob.exc import HTTPServiceUnavailable
 
 LOG = logging.getLogger(__name__)
 
@@ -103,11 +108,39 @@ def wait_on_futures(futures):
     return map(lambda f: f.result(), futures)
 
 
-def get_midonet_api():
+def run_in_parallel(funcs, max_workers=10):
     """
+    Runs the given functions concurrently and returns their results, in the
+    same order. All of them run to completion before the error of the first
+    failed function, if any, is raised.
+
+    :param funcs: list of functions taking no arguments
+    """
+    if not funcs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(funcs))) \
+            as executor:
+        futures = [executor.submit(func) for func in funcs]
+    return wait_on_futures(futures)
+
+
+def get_midonet_api(timeout=300):
+    """
+    Returns the API client of the cluster, shared by all callers.
+
+    :param timeout: seconds to wait for the API if it fails its check
     :rtype: midonetclient.api.MidonetApi
     """
-    return service.get_container_by_hostname('cluster1').get_midonet_api()
+    return service.get_container_by_hostname('cluster1').get_midonet_api(
+        timeout=timeout)
+
+
+def reset_midonet_api():
+    """
+    Drops the shared API client of the cluster, e.g. after an error, so that a
+    new one is created and checked on next use.
+    """
+    service.get_container_by_hostname('cluster1').reset_midonet_api()
 
 
 def get_neutron_api():
@@ -359,11 +392,32 @@ def execute_mn_conf(switch_flag, switch_id, config):
     conf_file.close()
 
 
+def _call_ignoring_not_found(func, attempts=5, delay=1):
+    """
+    Calls a MidoNet API update or delete, treating a missing resource as
+    already deleted, and retrying while the resource is still in use or the
+    API is unavailable.
+    """
+    for attempt in range(attempts):
+        try:
+            return func()
+        except HTTPNotFound:
+            return
+        except (HTTPConflict, HTTPServiceUnavailable):
+            if attempt == attempts - 1:
+                raise
+            time.sleep(delay)
+
+
 def clear_virtual_topology_for_tenants(tenant_name_prefix):
     """
     Delete the virtual topology for tenants whose name starts
     with tenant_name_prefix
 
+    The resources are deleted one level at a time, concurrently within a
+    level: the links between ports, the ports, the routers, bridges and rules,
+    and finally the chains.
+
     Args:
         tenant_name_prefix: the prefix of the tenant name
     """
@@ -372,34 +426,32 @@ def clear_virtual_topology_for_tenants(tenant_name_prefix):
     tenants = filter(lambda x: x.name.startswith(tenant_name_prefix),
                      list_tenants())
 
+    devices = []
+    chains = []
     for tenant in tenants:
-        # delete routers
-        for router in api.get_routers({'tenant_id': tenant.id}):
-            # unlink and delete all router ports
-            for port in router.get_ports():
-                if port.get_type() == 'InteriorRouter':
-                    if port.get_peer_id():
-                        port.unlink()
-                port.delete()
-            # delete router
-            router.delete()
-
-        # delete bridges
-        for bridge in api.get_bridges({'tenant_id': tenant.id}):
-            # unlink and delete all bridge ports
-            for port in bridge.get_ports():
-                if port.get_type() == 'InteriorBridge':
-                    if port.get_peer_id():
-                        port.unlink()
-                port.delete()
-            # delete router
-            bridge.delete()
-
-        # delete chains
-        for chain in api.get_chains({'tenant_id': tenant.id}):
-            for rule in chain.get_rules():
-                rule.delete()
-            chain.delete()
+        query = {'tenant_id': tenant.id}
+        devices += api.get_routers(query) + api.get_bridges(query)
+        chains += api.get_chains(query)
+
+    ports = sum(run_in_parallel([device.get_ports for device in devices]), [])
+    rules = sum(run_in_parallel([chain.get_rules for chain in chains]), [])
+
+    # unlink interior ports, only once for both ends of a link
+    unlinked = set()
+    for port in ports:
+        if port.get_type() in ('InteriorRouter', 'InteriorBridge') and \
+                port.get_peer_id() and port.get_peer_id() not in unlinked:
+            unlinked.add(port.get_id())
+    run_in_parallel(
+        [partial(_call_ignoring_not_found, port.unlink)
+         for port in ports if port.get_id() in unlinked])
+
+    run_in_parallel([partial(_call_ignoring_not_found, port.delete)
+                     for port in ports])
+    run_in_parallel([partial(_call_ignoring_not_found, resource.delete)
+                     for resource in devices + rules])
+    run_in_parallel([partial(_call_ignoring_not_found, chain.delete)
+                     for chain in chains])
 
 
 def clear_physical_topology():
@@ -453,12 +505,43 @@ def ipv4_int(ipv4_str):
 
 
 def await_port_active(vport_id, active=True, timeout=120, sleep_period=5):
-    midonet_api = get_midonet_api()
-    time.sleep(1)  # Initial, hopeful, short sleep
-    while midonet_api.get_port(vport_id).get_active() != active:
-        time.sleep(sleep_period)
-        timeout -= sleep_period
-        if timeout <= 0:
-            raise Exception("Port {0} did not become {1}."
-                            .format(vport_id,
-                                    "active" if active else "inactive"))
+    await_ports_active([vport_id], active, timeout, sleep_period)
+
+
+def await_ports_active(vport_ids, active=True, timeout=120, sleep_period=5):
+    """
+    Waits for all the given ports to become active (or inactive).
+
+    The ports still pending are checked concurrently, with a shared API
+    client, at intervals growing exponentially from 0.1 seconds up to
+    `sleep_period` seconds.
+    """
+    deadline = time.time() + timeout
+    interval = 0.1
+    pending = list(vport_ids)
+    error = None
+    while True:
+        try:
+            api = get_midonet_api(timeout=max(0, deadline - time.time()))
+            states = run_in_parallel(
+                [lambda v=vport_id: api.get_port(v).get_active()
+                 for vport_id in pending])
+            pending = [vport_id for vport_id, state in zip(pending, states)
+                       if state != active]
+            error = None
+        except Exception as e:
+            LOG.warn("Error checking the state of ports %s, retrying. %s" %
+                     (pending, e))
+            reset_midonet_api()
+            error = e
+        if not pending:
+            return
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise Exception("Ports {0} did not become {1}.{2}"
+                            .format(", ".join(map(str, pending)),
+                                    "active" if active else "inactive",
+                                    " Last error: %s" % error if error
+                                    else ""))
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, sleep_period)
@@ -0,0 +1,107 @@
+# Copyright (C) 2016 Midokura SARL
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from data_migration import exceptions as exc
+import json
+import logging
+import os
+
+LOG = logging.getLogger(name="data_migration")
+
+
+class Checkpoint(object):
+    """Progress of a migration, saved to a file after each committed batch
+
+    The checkpoint holds the index of the last `_CREATES` stage with committed
+    tasks, and the ID of the last object of that stage whose tasks were
+    committed. Objects are processed in ID order within a stage, so a rerun
+    skips everything up to and including that object.
+
+    The checkpoint also records the ID of the last task written, so that a
+    rerun only looks for the tasks of an uncheckpointed batch among the tasks
+    written after it, and the partition of the data being migrated, so that a
+    rerun for another partition does not resume from it.
+    """
+
+    def __init__(self, path=None, partition=None):
+        """
+        :type path: str|None
+        :type partition: str|None
+        """
+        self.path = path
+        self.partition = partition
+        self.stage = -1
+        self.key = None
+        self.resource_id = None
+        self.task_id = None
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            try:
+                state = json.load(f)
+                self.stage = state['stage']
+                self.key = state['key']
+                self.resource_id = state['resource_id']
+                self.task_id = state.get('task_id')
+                partition = state.get('partition')
+            except (ValueError, KeyError):
+                raise exc.UpgradeScriptException(
+                    'Invalid checkpoint file: ' + self.path)
+        if partition != self.partition:
+            raise exc.UpgradeScriptException(
+                'Checkpoint file ' + self.path + ' was written for another '
+                'partition: ' + str(partition))
+        LOG.info("Resuming the migration after %s %s", self.key,
+                 self.resource_id)
+
+    def check_stages(self, stage_keys):
+        """Checks that the checkpoint was taken with the same stages
+
+        :type stage_keys: list[str]
+        """
+        if self.stage < 0:
+            return
+        if self.stage >= len(stage_keys) or \
+                stage_keys[self.stage] != self.key:
+            raise exc.UpgradeScriptException(
+                'Checkpoint file ' + self.path + ' does not match the '
+                'migration stages')
+
+    def is_done(self, stage, resource_id):
+        """Returns whether the tasks of an object were already committed"""
+        if stage != self.stage:
+            return stage < self.stage
+        return resource_id <= self.resource_id
+
+    def save(self, stage, key, resource_id, task_id=None):
+        self.stage = stage
+        self.key = key
+        self.resource_id = resource_id
+        if task_id is not None:
+            self.task_id = task_id
+        if not self.path:
+            return
+        # Write then rename, so that the file is never left half written
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'stage': stage, 'key': key,
+                       'resource_id': resource_id,
+                       'task_id': self.task_id,
+                       'partition': self.partition}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
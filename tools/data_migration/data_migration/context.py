@@ -32,5 +32,9 @@ class MigrationContext(object):
         self.client = plugin.MidonetPluginV2()
         self.lb_client = loadbalancer_db.LoadBalancerPluginDb()
 
+    def new_context(self):
+        """Returns a new admin context, with a DB session of its own"""
+        return ncntxt.get_admin_context()
+
 
 migration_context = MigrationContext()
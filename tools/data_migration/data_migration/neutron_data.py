@@ -13,63 +13,97 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+from data_migration import checkpoint as cp
 from data_migration import context as ctx
 from data_migration import exceptions as exc
+from data_migration import report as rp
+from data_migration.stats import stats
 from data_migration import utils
+import json
 import logging
 import midonet.neutron.db.task_db as task
+from neutron.db import l3_db
+from neutron.db import models_v2
+from neutron.db import securitygroups_db
+from neutron_lbaas.db.loadbalancer import loadbalancer_db
+from oslo_serialization import jsonutils
+import Queue
+import sqlalchemy as sa
+import threading
+import time
 
 LOG = logging.getLogger(name="data_migration")
 migration_context = ctx.migration_context
 
+DEFAULT_BATCH_SIZE = 500
 
-def _get_neutron_objects(key, func, context, filter_list=None):
-    if filter_list is None:
-        filter_list = []
 
-    retmap = {key: {}}
-    submap = retmap[key]
+def _iter_neutron_objects(key, func, context, filter_list=None, paged=False,
+                          page_size=DEFAULT_BATCH_SIZE):
+    """Yields the objects returned by a Neutron query
 
-    LOG.debug("\n[" + key + "]")
-
-    filters = {}
-    for f in filter_list:
-        new_filter = f.func_filter()
-        if new_filter:
-            filters.update({new_filter[0]: new_filter[1]})
-
-    object_list = func(context=context, filters=filters if filters else None)
-
-    for f in filter_list:
-        f.post_filter(object_list)
+    The objects are yielded in ID order. If `paged` is set, the query is run
+    repeatedly, fetching `page_size` objects each time, so that only one page
+    of objects is held in memory at a time.
+    """
+    filter_chain = utils.FilterChain(filter_list)
 
-    for obj in object_list:
-        if 'id' not in obj:
-            raise exc.UpgradeScriptException(
-                'Trying to parse an object with no ID field: ' + str(obj))
-
-        singular_noun = key[:-1] if key.endswith('s') else key
-        LOG.debug("\t[" + singular_noun + " " + obj['id'] + "]: " + str(obj))
-
-        submap[obj['id']] = obj
+    LOG.debug("\n[" + key + "]")
 
-    return retmap
+    filters = filter_chain.query_filters() or None
+    singular_noun = key[:-1] if key.endswith('s') else key
+    marker = None
+    while True:
+        with stats.timer('query.' + key):
+            if paged:
+                object_list = func(context=context, filters=filters,
+                                   sorts=[('id', True)], limit=page_size,
+                                   marker=marker)
+            else:
+                object_list = func(context=context, filters=filters)
+                object_list.sort(key=lambda obj: obj.get('id'))
+        stats.incr('fetched.' + key, len(object_list))
+        # The marker must be taken from the unfiltered page
+        page_len = len(object_list)
+        if object_list:
+            marker = object_list[-1].get('id')
+
+        for obj in filter_chain.filter(object_list):
+            if 'id' not in obj:
+                raise exc.UpgradeScriptException(
+                    'Trying to parse an object with no ID field: ' + str(obj))
+
+            LOG.debug("\t[%s %s]", singular_noun, obj['id'])
+            yield obj
+
+        if not paged or page_len < page_size or marker is None:
+            return
+
+
+def _index_by_fixed_ip(ports):
+    """Indexes ports by the (subnet ID, IP address) of their first fixed IP
+
+    The first port found wins when several ports share a fixed IP.
+    """
+    index = {}
+    for port in ports:
+        if 'fixed_ips' in port and len(port['fixed_ips']) > 0:
+            fixed_ip = port['fixed_ips'][0]
+            index.setdefault((fixed_ip['subnet_id'], fixed_ip['ip_address']),
+                             port)
+    return index
 
 
 def _get_subnet_router(context, filters=None):
     new_list = []
     client = migration_context.client
     subnets = client.get_subnets(context=context)
+    interfaces = client.get_ports(context=context, filters=filters)
+    gw_ifaces = _index_by_fixed_ip(interfaces)
     for subnet in subnets:
         subnet_id = subnet['id']
-        subnet_gw_ip = subnet['gateway_ip']
-        interfaces = client.get_ports(context=context, filters=filters)
-        gw_iface = next(
-            (i for i in interfaces
-                if ('fixed_ips' in i and len(i['fixed_ips']) > 0 and
-                    i['fixed_ips'][0]['ip_address'] == subnet_gw_ip and
-                    i['fixed_ips'][0]['subnet_id'] == subnet_id)),
-            None)
+        gw_iface = gw_ifaces.get((subnet_id, subnet['gateway_ip']))
         gw_id = None
         if gw_iface:
             gw_id = gw_iface['device_id']
@@ -88,10 +122,12 @@ def _task_create_by_id(_topo, task_model, oid, obj):
 
 def _task_lb(topo, task_model, pid, lb_obj):
     lb_subnet = lb_obj['subnet_id']
-    router_id = topo['subnet-gateways'][lb_subnet]['gw_router_id']
+    subnet_gw = topo['subnet-gateways'].get(lb_subnet)
+    router_id = subnet_gw['gw_router_id'] if subnet_gw else None
     if not router_id:
         raise exc.UpgradeScriptException(
-            "LB Pool's subnet has no associated gateway router: " + lb_obj)
+            "LB Pool's subnet has no associated gateway router: " +
+            str(lb_obj))
     LOG.debug("Preparing " + task_model + ": " + str(pid) +
               " on router " + router_id)
     new_lb_obj = lb_obj.copy()
@@ -120,9 +156,10 @@ def _task_router(_topo, task_model, rid, router_obj):
             'data': routeless_router}
 
 
-def _task_router_interface(topo, task_model, pid, port):
-    router_obj = topo['routers'][port['device_id']]
-    router_id = router_obj['id']
+def _task_router_interface(_topo, task_model, pid, port):
+    # Routers are streamed rather than looked up, so the router of the
+    # interface is not checked to exist
+    router_id = port['device_id']
     LOG.debug("Preparing " + task_model + " on ROUTER: " + str(pid) +
               " on router: " + router_id)
     if 'fixed_ips' not in port:
@@ -165,49 +202,217 @@ _CREATES = [
 ]
 
 
-# (topo map key, obj fetch func, list of Filter objects to run on fetch)
+# (topo map key, obj fetch func, list of Filter objects to run on fetch,
+#  whether the fetch func supports paging)
 _GET_QUERIES = [
-    ('security-groups', migration_context.client.get_security_groups, []),
-    ('networks', migration_context.client.get_networks, []),
-    ('subnets', migration_context.client.get_subnets, []),
-    ('ports', migration_context.client.get_ports, []),
-    ('routers', migration_context.client.get_routers, []),
+    ('security-groups', migration_context.client.get_security_groups, [],
+     True),
+    ('networks', migration_context.client.get_networks, [], True),
+    ('subnets', migration_context.client.get_subnets, [], True),
+    ('ports', migration_context.client.get_ports, [], True),
+    ('routers', migration_context.client.get_routers, [], True),
     ('router-interfaces', migration_context.client.get_ports,
      [utils.ListFilter(check_key='device_owner',
-                       check_list=['network:router_interface'])]),
+                       check_list=['network:router_interface'])], True),
     ('subnet-gateways', _get_subnet_router,
      [utils.ListFilter(check_key='device_owner',
-                 check_list=['network:router_interface'])]),
-    ('floating-ips', migration_context.client.get_floatingips, []),
-    ('load-balancer-pools', migration_context.lb_client.get_pools, []),
-    ('members', migration_context.lb_client.get_members, []),
-    ('vips', migration_context.lb_client.get_vips, []),
+                       check_list=['network:router_interface'])], False),
+    ('floating-ips', migration_context.client.get_floatingips, [], True),
+    ('load-balancer-pools', migration_context.lb_client.get_pools, [], False),
+    ('members', migration_context.lb_client.get_members, [], False),
+    ('vips', migration_context.lb_client.get_vips, [], False),
     ('health-monitors', migration_context.lb_client.get_health_monitors,
-     [utils.MinLengthFilter(field='pools', min_len=1)]),
+     [utils.MinLengthFilter(field='pools', min_len=1)], False),
 ]
 
-
-def _create_obj_map():
-    """Creates a map of object ID -> object from Neutron DB"""
-    obj_map = {}
-    migration_context = ctx.migration_context
-    for key, func, filter_list in _GET_QUERIES:
-        obj_map.update(
-            _get_neutron_objects(key=key, func=func,
-                                 context=migration_context.ctx,
-                                 filter_list=filter_list))
-    return obj_map
-
-
-def _create_task_list(obj_map):
-    """Creates a list of tasks to run given a map of object ID -> object"""
-    task_list = []
-    for key, model, func in _CREATES:
-        for oid, obj in obj_map[key].iteritems():
-            elem = func(obj_map, model, oid, obj)
+_QUERIES = {q[0]: q for q in _GET_QUERIES}
+
+# Queries whose results are looked up by ID while creating the tasks, and thus
+# are fully read before the tasks are created. Everything else is streamed.
+_LOOKUP_QUERIES = ['subnet-gateways']
+
+
+def _run_query(key, page_size=DEFAULT_BATCH_SIZE, extra_filters=None):
+    """Yields the objects of a query, in a context of its own
+
+    Each query runs in its own context, and thus its own DB session, so that
+    queries can run concurrently.
+    """
+    _key, func, filter_list, paged = _QUERIES[key]
+    filter_list = filter_list + (extra_filters or [])
+    start = time.time()
+    count = 0
+    for obj in _iter_neutron_objects(key=key, func=func,
+                                     context=migration_context.new_context(),
+                                     filter_list=filter_list, paged=paged,
+                                     page_size=page_size):
+        count += 1
+        yield obj
+    stats.incr('objects.' + key, count)
+    LOG.info("Fetched %d %s in %.2fs", count, key, time.time() - start)
+
+
+def _create_lookup_map(page_size=DEFAULT_BATCH_SIZE):
+    """Creates a map of object ID -> object for the lookup queries"""
+    return {key: {obj['id']: obj for obj in _run_query(key, page_size)}
+            for key in _LOOKUP_QUERIES}
+
+
+class _Failure(object):
+
+    def __init__(self, error):
+        self.error = error
+
+
+_END = object()
+
+
+def _produce(iterable, queue):
+    try:
+        for item in iterable:
+            queue.put(item)
+    except Exception as e:
+        LOG.exception("Error while reading the Neutron data")
+        queue.put(_Failure(e))
+    queue.put(_END)
+
+
+def _consume(queue):
+    while True:
+        item = queue.get()
+        if item is _END:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+
+def _read_ahead(iterables, workers, max_items):
+    """Yields an iterator for each iterable of `iterables`, in order
+
+    Up to `workers` iterables are read ahead in background threads, each of
+    them buffering at most `max_items` items.
+    """
+    iterables = iter(iterables)
+    pending = collections.deque()
+
+    def start_next():
+        iterable = next(iterables, None)
+        if iterable is not None:
+            queue = Queue.Queue(max_items)
+            thread = threading.Thread(target=_produce, args=(iterable, queue))
+            thread.daemon = True
+            thread.start()
+            pending.append(queue)
+
+    for _ in range(max(1, workers)):
+        start_next()
+    while pending:
+        queue = pending.popleft()
+        yield _consume(queue)
+        start_next()
+
+
+def _iter_tasks(lookup_map, workers=1, page_size=DEFAULT_BATCH_SIZE,
+               checkpoint=None, partition_filters=None):
+    """Yields the tasks to run, in the order of _CREATES
+
+    The objects of each stage are streamed from the Neutron DB. The stages
+    coming next are read concurrently on up to `workers` threads. The tasks
+    are yielded as (stage index, object ID, task) tuples, skipping the objects
+    already done according to `checkpoint`, and the objects that do not match
+    `partition_filters`.
+    """
+    if checkpoint is None:
+        checkpoint = cp.Checkpoint()
+    first = max(0, checkpoint.stage)
+    stages = (_run_query(key, page_size, partition_filters)
+              for key, _model, _func in _CREATES[first:])
+    for i, objs in enumerate(_read_ahead(stages, workers, page_size), first):
+        key, model, func = _CREATES[i]
+        stage = 'stage.%02d.%s.%s' % (i, key, model)
+        for obj in objs:
+            if checkpoint.is_done(i, obj['id']):
+                stats.incr(stage + '.skipped')
+                continue
+            with stats.timer(stage):
+                elem = func(lookup_map, model, obj['id'], obj)
             if elem:
-                task_list.append(elem)
-    return task_list
+                stats.incr(stage + '.tasks')
+                yield i, obj['id'], elem
+
+
+def _batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _task_row(t, context):
+    # Same columns as task_db.create_task, created_at being set by default
+    return {'type': t['type'],
+            'tenant_id': context.tenant,
+            'data_type': t['data_type'],
+            'data': None if t['data'] is None else jsonutils.dumps(t['data']),
+            'resource_id': t['resource_id'],
+            'transaction_id': context.request_id}
+
+
+def _write_tasks(tasks):
+    """Writes a batch of tasks with a single multi-row insert
+
+    :return: the ID of the last task in the table once the batch is written
+    """
+    context = migration_context.ctx
+    with stats.timer('write'):
+        with context.session.begin(subtransactions=True):
+            context.session.execute(task.Task.__table__.insert(),
+                                    [_task_row(t, context) for t in tasks])
+            last_id = context.session.query(
+                sa.func.max(task.Task.id)).scalar()
+    stats.incr('written', len(tasks))
+    return last_id
+
+
+def _task_key(type_, data_type, resource_id, data):
+    """Identifies the object of a task
+
+    The resource of a router interface task is its router, so the interfaces
+    of a router are told apart by their ports.
+    """
+    port_id = data['port_id'] if data_type == "ROUTERINTERFACE" else None
+    return type_, data_type, resource_id, port_id
+
+
+def _key_of(t):
+    return _task_key(t['type'], t['data_type'], t['resource_id'], t['data'])
+
+
+def _existing_in_batch(context, tasks, after_task_id=None):
+    """Returns the keys of the tasks of a batch already in the task table
+
+    :param after_task_id: only look at the tasks with a greater ID
+    """
+    resource_ids = {t['resource_id'] for t in tasks}
+    query = context.session.query(
+        task.Task.type, task.Task.data_type, task.Task.resource_id,
+        task.Task.data).filter(task.Task.resource_id.in_(resource_ids))
+    if after_task_id is not None:
+        query = query.filter(task.Task.id > after_task_id)
+    return {_task_key(type_, data_type, resource_id,
+                      jsonutils.loads(data)
+                      if data_type == "ROUTERINTERFACE" else None)
+            for type_, data_type, resource_id, data in query}
+
+
+def _uncommitted(tasks, committed):
+    """Returns the tasks whose keys are not in `committed`"""
+    return [t for t in tasks if _key_of(t) not in committed]
 
 
 def _dry_run_output(task):
@@ -215,12 +420,112 @@ def _dry_run_output(task):
                                  task['resource_id']])
 
 
-def migrate(dry_run=False):
+# Models of the migrated objects, to find the tenants owning them
+_TENANT_MODELS = [securitygroups_db.SecurityGroup, models_v2.Network,
+                  models_v2.Subnet, models_v2.Port, l3_db.Router,
+                  l3_db.FloatingIP, loadbalancer_db.Pool,
+                  loadbalancer_db.Member, loadbalancer_db.Vip,
+                  loadbalancer_db.HealthMonitor]
+
+
+def _tenant_ids():
+    """Returns the IDs of the tenants owning objects to migrate
+
+    The IDs include '' if some objects have no tenant, such as router gateway
+    ports.
+    """
+    session = migration_context.new_context().session
+    tenant_ids = set()
+    with stats.timer('query.tenants'):
+        for model in _TENANT_MODELS:
+            tenant_ids.update(
+                row[0] for row in session.query(model.tenant_id).distinct())
+    if None in tenant_ids:
+        tenant_ids.discard(None)
+        LOG.warning("Some objects have a NULL tenant ID, they are not part "
+                    "of any shard")
+    return tenant_ids
+
+
+def _partition(tenant_ids=None, shard=None):
+    """Returns the filters selecting the objects of a migration partition
+
+    The partition is turned into a list of tenants pushed down into the
+    Neutron queries. Objects with an empty tenant ID belong to the first
+    shard.
+
+    :param tenant_ids: IDs of the tenants to migrate
+    :param shard: (index, count) of the shard of tenants to migrate, the index
+                  going from 0 to count - 1
+    :return: (filter or None, name of the partition)
+    """
+    names = []
+    if tenant_ids:
+        names.append('tenants ' + ','.join(sorted(tenant_ids)))
+    if shard:
+        tenant_filter = utils.ShardFilter(tenant_ids or _tenant_ids(),
+                                          shard[0], shard[1])
+        names.append('shard %d/%d' % (shard[0] + 1, shard[1]))
+    elif tenant_ids:
+        tenant_filter = utils.TenantFilter(tenant_ids)
+    else:
+        tenant_filter = None
+    return tenant_filter, ' '.join(names) or None
+
+
+def migrate(dry_run=False, workers=1, batch_size=DEFAULT_BATCH_SIZE,
+            checkpoint_file=None, tenant_ids=None, shard=None):
     LOG.info('Running migration process')
-    obj_map = _create_obj_map()
-    tasks = _create_task_list(obj_map)
-    for t in tasks:
+    stats.reset()
+    tenant_filter, partition = _partition(tenant_ids, shard)
+    if partition:
+        LOG.info('Migrating %s', partition)
+        if not tenant_filter.check_list:
+            # An empty filter would not restrict the queries
+            LOG.info('No tenant in %s, nothing to migrate', partition)
+            return
+    partition_filters = [tenant_filter] if tenant_filter else None
+    checkpoint = cp.Checkpoint(checkpoint_file, partition)
+    checkpoint.load()
+    checkpoint.check_stages([key for key, _model, _func in _CREATES])
+
+    with stats.timer('lookup'):
+        lookup_map = _create_lookup_map(page_size=batch_size)
+    tasks = _iter_tasks(lookup_map, workers=workers, page_size=batch_size,
+                        checkpoint=checkpoint,
+                        partition_filters=partition_filters)
+    if dry_run:
+        report = rp.DryRunReport(batch_size)
+        dry_run_context = migration_context.new_context()
+    # When resuming, the batches following the checkpoint may have been
+    # committed without the checkpoint being saved. The committed tasks come
+    # first, so they are looked for until a batch is not fully committed,
+    # among the tasks written after the last checkpointed one.
+    resuming = checkpoint.stage >= 0
+    count = 0
+    for batch in _batches(tasks, batch_size):
         if dry_run:
-            print(_dry_run_output(t))
+            existing = _existing_in_batch(dry_run_context,
+                                          [t for _stage, _oid, t in batch])
+            for _stage, _oid, t in batch:
+                LOG.debug(_dry_run_output(t))
+                report.add(t, _key_of(t) in existing)
         else:
-            task.create_task(migration_context.ctx, **t)
+            new_tasks = [t for _stage, _oid, t in batch]
+            if resuming:
+                committed = _existing_in_batch(migration_context.ctx,
+                                               new_tasks, checkpoint.task_id)
+                new_tasks = _uncommitted(new_tasks, committed)
+                resuming = not new_tasks
+                if len(new_tasks) < len(batch):
+                    LOG.info("Skipping %d tasks already written",
+                             len(batch) - len(new_tasks))
+            last_task_id = _write_tasks(new_tasks) if new_tasks else None
+            stage, oid, _t = batch[-1]
+            checkpoint.save(stage, _CREATES[stage][0], oid, last_task_id)
+        count += len(batch)
+        LOG.debug("%d tasks processed", count)
+    LOG.info("%d tasks %s", count, "found" if dry_run else "written")
+    if dry_run:
+        print(report.format())
+    LOG.info("Summary: %s", json.dumps(stats.summary(), sort_keys=True))
@@ -0,0 +1,99 @@
+# Copyright (C) 2016 Midokura SARL
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import midonet.neutron.db.task_db as task
+
+# Rough number of MidoNet objects written when translating a task of each data
+# type, used to estimate the load put on the MidoNet cluster. Security group
+# rules are counted separately.
+_API_OPS = {
+    task.SECURITY_GROUP: 3,   # inbound and outbound chains, IP address group
+    task.NETWORK: 1,          # bridge
+    task.SUBNET: 1,           # DHCP subnet
+    task.PORT: 3,             # port, DHCP host, anti-spoofing chain
+    task.ROUTER: 3,           # router, inbound and outbound chains
+    "ROUTERINTERFACE": 5,     # router port, link, routes, NAT rules
+    task.FLOATING_IP: 3,      # SNAT and DNAT rules, route
+    task.POOL: 2,             # load balancer, pool
+    task.MEMBER: 1,           # pool member
+    task.VIP: 1,              # VIP
+    task.HEALTH_MONITOR: 1,   # health monitor
+}
+
+
+class DryRunReport(object):
+    """Aggregated statistics about the tasks of a migration"""
+
+    def __init__(self, batch_size, top=10):
+        """
+        :type batch_size: int
+        :type top: int
+        """
+        self.batch_size = batch_size
+        self.top = top
+        self.counts = collections.Counter()
+        self.api_ops = 0
+        self.router_fan_out = collections.Counter()
+        self.network_fan_out = collections.Counter()
+        self.existing = collections.Counter()
+
+    def add(self, t, existing=False):
+        """Accounts for a task
+
+        :type t: dict[str, any]
+        :param existing: whether the task is already in the task table
+        """
+        data_type = t['data_type']
+        data = t['data']
+        self.counts[(t['type'], data_type)] += 1
+        if existing:
+            self.existing[(t['type'], data_type)] += 1
+        self.api_ops += _API_OPS.get(data_type, 1)
+        if data_type == task.SECURITY_GROUP:
+            self.api_ops += len(data.get('security_group_rules') or ())
+        elif data_type == "ROUTERINTERFACE":
+            self.router_fan_out[t['resource_id']] += 1
+        elif data_type == task.FLOATING_IP and data.get('router_id'):
+            self.router_fan_out[data['router_id']] += 1
+        elif data_type in (task.PORT, task.SUBNET):
+            self.network_fan_out[data['network_id']] += 1
+
+    def _lines(self):
+        total = sum(self.counts.values())
+        existing = sum(self.existing.values())
+        yield "Tasks per data type (already in the task table):"
+        for (type_, data_type), count in sorted(self.counts.items()):
+            yield "  %-8s %-16s %8d (%d)" % (
+                type_, data_type, count,
+                self.existing[(type_, data_type)])
+        yield "  %-25s %8d (%d)" % ("total", total, existing)
+        yield "New tasks: %d" % (total - existing)
+        yield ""
+        yield "Estimated operations:"
+        yield "  task table inserts: %d rows in %d transactions" % (
+            total, (total + self.batch_size - 1) // self.batch_size)
+        yield "  MidoNet objects written: %d" % self.api_ops
+        for name, fan_out, what in [
+                ("routers", self.router_fan_out,
+                 "interfaces and floating IPs"),
+                ("networks", self.network_fan_out, "ports and subnets")]:
+            yield ""
+            yield "Largest %s (%s):" % (name, what)
+            for oid, count in fan_out.most_common(self.top):
+                yield "  %s %8d" % (oid, count)
+
+    def format(self):
+        return "\n".join(self._lines())
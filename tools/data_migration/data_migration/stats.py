@@ -0,0 +1,68 @@
+# Copyright (C) 2016 Midokura SARL
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import contextlib
+import threading
+import time
+
+
+class Stats(object):
+    """Timers and counters of a migration, updated from several threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.start = time.time()
+            # name -> [number of timed calls, total seconds, max seconds]
+            self.timers = {}
+            self.counters = collections.Counter()
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self.counters[name] += count
+
+    def summary(self):
+        """Returns the timers and counters as a JSON serializable dict"""
+        with self._lock:
+            return {
+                'elapsed': round(time.time() - self.start, 3),
+                'timers': {name: {'calls': calls,
+                                  'total': round(total, 3),
+                                  'max': round(max_, 3)}
+                           for name, (calls, total, max_)
+                           in self.timers.items()},
+                'counters': dict(self.counters)}
+
+
+stats = Stats()
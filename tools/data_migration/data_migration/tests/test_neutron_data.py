@@ -0,0 +1,87 @@
+# Copyright (C) 2016 Midokura SARL
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo_serialization import jsonutils
+import sys
+import unittest
+
+# The migration context connects to the Neutron DB when imported
+sys.modules.setdefault('data_migration.context', mock.MagicMock())
+
+from data_migration import neutron_data as nd  # noqa
+
+
+class FakeQuery(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *args):
+        return self
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+def _interface_task(router_id, port_id):
+    return nd._task_router_interface(
+        {}, "ROUTERINTERFACE", port_id,
+        {'device_id': router_id,
+         'fixed_ips': [{'subnet_id': 'subnet-' + port_id}]})
+
+
+def _row(t):
+    return (t['type'], t['data_type'], t['resource_id'],
+            jsonutils.dumps(t['data']))
+
+
+class TestTaskKeys(unittest.TestCase):
+
+    def test_interfaces_of_a_router_have_different_keys(self):
+        first = _interface_task('router1', 'port1')
+        second = _interface_task('router1', 'port2')
+        self.assertEqual(first['resource_id'], second['resource_id'])
+        self.assertNotEqual(nd._key_of(first), nd._key_of(second))
+
+    def test_existing_interface_does_not_hide_another_one(self):
+        first = _interface_task('router1', 'port1')
+        second = _interface_task('router1', 'port2')
+        context = mock.Mock()
+        context.session.query.return_value = FakeQuery([_row(first)])
+
+        existing = nd._existing_in_batch(context, [first, second])
+        self.assertIn(nd._key_of(first), existing)
+        self.assertNotIn(nd._key_of(second), existing)
+
+    def test_resume_writes_the_interfaces_not_committed(self):
+        first = _interface_task('router1', 'port1')
+        second = _interface_task('router1', 'port2')
+        committed = {nd._key_of(first)}
+        self.assertEqual([second], nd._uncommitted([first, second],
+                                                   committed))
+
+
+class TestShards(unittest.TestCase):
+
+    def test_every_tenant_falls_in_one_shard(self):
+        for tenant_id in ['', 'tenant1', 'tenant2', u'tenant3']:
+            shards = [i for i in range(4)
+                      if nd.utils.in_shard(tenant_id, i, 4)]
+            self.assertEqual(1, len(shards))
+
+    def test_objects_with_no_tenant_are_in_the_first_shard(self):
+        shard = nd.utils.ShardFilter(['', 'tenant1'], 0, 4)
+        self.assertIn('', shard.check_list)
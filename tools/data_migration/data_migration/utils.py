@@ -13,20 +13,53 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import zlib
+
 
 class QueryFilter(object):
+    """Filter on the objects returned by a Neutron query
+
+    Filters that can be expressed as Neutron query filters are pushed down
+    into the query, the others are checked on each returned object.
+    """
 
-    def func_filter(self):
+    def query_filters(self):
         """
-        :return: dict[str, any]|None
+        :return: dict[str, any]
+        """
+        return {}
+
+    def matches(self, obj):
+        """
+        :type obj: dict[str,any]
+        :rtype: bool
+        """
+        return True
+
+    def filter(self, objects):
+        """Yields the objects that match the filter, in a single pass
+
+        :type objects: collections.Iterable[dict[str,any]]
         """
-        return None
+        return (obj for obj in objects if self.matches(obj))
+
 
-    def post_filter(self, object_list=list()):
+class FilterChain(QueryFilter):
+
+    def __init__(self, filters=None):
         """
-        :type object_list: list[dict[str,any]]
+        :type filters: list[QueryFilter]|None
         """
-        pass
+        self.filters = filters or []
+
+    def query_filters(self):
+        filters = {}
+        for f in self.filters:
+            filters.update(f.query_filters())
+        return filters
+
+    def matches(self, obj):
+        return all(f.matches(obj) for f in self.filters)
 
 
 class ListFilter(QueryFilter):
@@ -39,8 +72,8 @@ class ListFilter(QueryFilter):
         self.check_key = check_key
         self.check_list = check_list
 
-    def func_filter(self):
-        return self.check_key, self.check_list
+    def query_filters(self):
+        return {self.check_key: self.check_list}
 
 
 class MinLengthFilter(QueryFilter):
@@ -53,7 +86,48 @@ class MinLengthFilter(QueryFilter):
         self.field = field
         self.min_len = min_len
 
-    def post_filter(self, object_list=list()):
-        for obj in object_list:
-            if self.field not in obj or len(obj[self.field]) < self.min_len:
-                object_list.remove(obj)
+    def matches(self, obj):
+        return len(obj.get(self.field) or ()) >= self.min_len
+
+
+class TenantFilter(ListFilter):
+
+    def __init__(self, tenant_ids):
+        """
+        :type tenant_ids: list[str]
+        """
+        super(TenantFilter, self).__init__(check_key='tenant_id',
+                                           check_list=tenant_ids)
+
+
+def in_shard(tenant_id, shard, shard_count):
+    """Returns whether a tenant falls in a shard
+
+    Tenants are spread over the shards by a hash of their IDs, so that all
+    the objects of a tenant belong to the same shard. The empty tenant ID,
+    of the objects with no tenant, falls in the first shard.
+
+    :type tenant_id: str
+    :param shard: index of the shard, from 0 to shard_count - 1
+    :type shard_count: int
+    """
+    if not tenant_id:
+        return shard == 0
+    return (zlib.crc32(tenant_id.encode('utf-8')) & 0xffffffff) % \
+        shard_count == shard
+
+
+class ShardFilter(TenantFilter):
+
+    def __init__(self, tenant_ids, shard, shard_count):
+        """Keeps the objects of the tenants that fall in a shard
+
+        The tenants of the shard are picked from `tenant_ids` up front, so
+        that the queries only return the objects of the shard.
+
+        :type tenant_ids: collections.Iterable[str]
+        :type shard: int
+        :type shard_count: int
+        """
+        super(ShardFilter, self).__init__(
+            [t for t in tenant_ids if in_shard(t, shard, shard_count)])
@@ -15,6 +15,7 @@
 #    under the License.
 
 import argparse
+import cProfile
 from data_migration import neutron_data as nd
 import logging
 
@@ -23,6 +24,18 @@ LOG = logging.getLogger(name="data_migration")
 logging.basicConfig(level=logging.INFO)
 
 
+def shard_arg(value):
+    """Parses a N/M shard argument into a 0-based (index, count) tuple"""
+    try:
+        index, count = [int(v) for v in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected N/M, got ' + value)
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            'N must be between 1 and M, got ' + value)
+    return index - 1, count
+
+
 def main():
     # Parse args
     parser = argparse.ArgumentParser(description='Prepare for data migration')
@@ -33,13 +46,54 @@ def main():
                              'taken, before exiting.')
     parser.add_argument('-d', '--debug', action='store_true', default=False,
                         help='Turn on debug logging (off by default).')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='Number of Neutron DB queries to run '
+                             'concurrently while reading the Neutron data '
+                             '(4 by default).')
+    parser.add_argument('-b', '--batch-size', type=int,
+                        default=nd.DEFAULT_BATCH_SIZE,
+                        help='Number of objects read per Neutron DB query, '
+                             'and of tasks written per transaction (%d by '
+                             'default).' % nd.DEFAULT_BATCH_SIZE)
+    parser.add_argument('-c', '--checkpoint', default=None,
+                        help='File recording the progress of the migration. '
+                             'If the file exists, the migration resumes '
+                             'after the last batch of tasks it records.')
+    parser.add_argument('-t', '--tenant', action='append', default=None,
+                        help='Only migrate the objects of this tenant. Can be '
+                             'given several times.')
+    parser.add_argument('-s', '--shard', type=shard_arg, default=None,
+                        metavar='N/M',
+                        help='Only migrate the objects of the tenants of the '
+                             'Nth shard out of M. Tenants are spread over '
+                             'the shards by a hash of their IDs. The tenants '
+                             'of the shard are listed first, and only their '
+                             'objects are read from the Neutron DB. Objects '
+                             'with an empty tenant ID belong to shard 1.')
+    parser.add_argument('-p', '--profile', default=None, metavar='FILE',
+                        help='Profile the migration with cProfile and write '
+                             'the profile data to FILE. Only the main thread, '
+                             'which creates and writes the tasks, is '
+                             'profiled.')
     args = parser.parse_args()
 
     # For now, just allow DEBUG or INFO
     LOG.setLevel(level=logging.DEBUG if args.debug else logging.INFO)
 
     # Start the migration
-    nd.migrate(dry_run=args.dryrun)
+    profile = cProfile.Profile() if args.profile else None
+    if profile:
+        profile.enable()
+    try:
+        nd.migrate(dry_run=args.dryrun, workers=args.workers,
+                   batch_size=args.batch_size,
+                   checkpoint_file=args.checkpoint, tenant_ids=args.tenant,
+                   shard=args.shard)
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(args.profile)
+            LOG.info("Profile data written to %s", args.profile)
 
 
 if __name__ == "__main__":